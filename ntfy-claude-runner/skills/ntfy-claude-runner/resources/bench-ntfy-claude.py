@@ -0,0 +1,841 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#   "textual>=1.0",
+#   "httpx[http2]",
+#   "orjson",
+#   "sh>=2.0",
+# ]
+# ///
+"""ntfy-claude-daemon benchmarks.
+
+Usage:
+  bench-ntfy-claude.py all [--sizes 1000,10000,100000] [--out results.json]
+  bench-ntfy-claude.py parser [TRANSCRIPT.jsonl ...]
+  bench-ntfy-claude.py store|render|ingest|startup|search [--sizes ...] [--engines sqlite,jsonl]
+  bench-ntfy-claude.py jobs [--jobs 50] [--concurrency 3] [--turns 20] [--pools 0,3]
+  bench-ntfy-claude.py compare BASE.json NEW.json [--threshold 0.1]
+  bench-ntfy-claude.py fake-ntfy [--port 18080] [--messages 1000] [--rate 0]
+  bench-ntfy-claude.py fake-claude ...
+
+parser  stream-json parser vs the original stdlib one, on recorded transcripts
+        (claude -p --output-format stream-json > x.jsonl) or a synthetic one
+store   JobStore open time, bulk load, add/update/page/get latency
+render  app startup and _refresh_job_list time, list and virtual mode
+ingest  messages/s from a local fake ntfy server into a store of N jobs
+jobs    end-to-end auto jobs against a fake claude emitting stream-json,
+        cold-started vs a warm session pool
+startup import time, first frame, store ready and ntfy connection, each
+        measured from process start, without and with a list snapshot
+search  full-text index build time, then query latency for rare and
+        common terms and for the next page of a query
+
+Every measurement runs in a fresh process against a throwaway data dir
+(NTFY_CLAUDE_DATA_DIR), so peak RSS is per scenario. Results are JSON
+records keyed by benchmark + params; `compare` diffs two result files and
+exits 1 on regressions beyond the threshold.
+"""
+
+import argparse
+import http.server
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DAEMON = Path(__file__).with_name("ntfy-claude-daemon.py")
+DEFAULT_SIZES = "1000,10000,100000"
+# Seconds a single scenario process may take
+RUN_TIMEOUT = 1800
+
+
+def load_daemon():
+    spec = importlib.util.spec_from_file_location("ntfy_claude_daemon", DAEMON)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def peak_rss_mib() -> float:
+    # Linux carries ru_maxrss across exec, so prefer this process's own VmHWM
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB on Linux
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles_ms(samples: list[float]) -> dict:
+    samples = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+# ── Reference parser (the original stdlib implementation) ───────────────────
+
+
+def legacy_format_tool_args(input_data: dict) -> str:
+    parts = []
+    for k, v in input_data.items():
+        if isinstance(v, str):
+            v_disp = v if len(v) <= 50 else v[:47] + "..."
+            parts.append(f'{k}="{v_disp}"')
+        else:
+            v_str = json.dumps(v, ensure_ascii=False)
+            if len(v_str) > 50:
+                v_str = v_str[:47] + "..."
+            parts.append(f"{k}={v_str}")
+    return ", ".join(parts)
+
+
+def legacy_parse_stream_json(stdout: str) -> tuple[list[dict], dict | None]:
+    steps: list[dict] = []
+    result_event = None
+    for line in stdout.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        etype = event.get("type")
+        if etype == "assistant":
+            for block in event.get("message", {}).get("content", []):
+                btype = block.get("type")
+                if btype == "text":
+                    text = block.get("text", "")
+                    if text.strip():
+                        steps.append({"type": "text", "content": text})
+                elif btype == "tool_use":
+                    name = block.get("name", "?")
+                    summary = f"{name}({legacy_format_tool_args(block.get('input', {}))})"
+                    if len(summary) > 200:
+                        summary = summary[:197] + "..."
+                    steps.append({"type": "tool_use", "content": summary})
+        elif etype == "result":
+            result_event = event
+    return steps, result_event
+
+
+# ── Synthetic data ──────────────────────────────────────────────────────────
+
+
+def transcript_lines(turns: int, seed: int = 0, max_body_lines: int = 400):
+    """stream-json events shaped like a long agent session, one per line."""
+    rng = random.Random(seed)
+    yield json.dumps({"type": "system", "subtype": "init", "session_id": "bench",
+                      "tools": ["Bash", "Read", "Edit", "Write"] * 10})
+    for i in range(turns):
+        body = "\n".join(f"line {j}: " + "x" * rng.randint(20, 120)
+                         for j in range(rng.randint(min(20, max_body_lines), max_body_lines)))
+        yield json.dumps({"type": "assistant", "message": {"content": [
+            {"type": "text", "text": f"Step {i}: looking at the code."},
+            {"type": "tool_use", "id": f"t{i}", "name": "Edit", "input": {
+                "file_path": f"/src/module_{i}.py", "old_string": body, "new_string": body[::-1],
+                "options": {"replace_all": False, "context": body.splitlines()[:50]}}},
+        ]}})
+        yield json.dumps({"type": "user", "message": {"content": [
+            {"type": "tool_result", "tool_use_id": f"t{i}", "content": body * 3}]}})
+    yield json.dumps({"type": "result", "result": "done", "total_cost_usd": 1.23,
+                      "duration_ms": 456789, "is_error": False})
+
+
+def synthetic_transcript(turns: int = 500, seed: int = 0) -> str:
+    return "\n".join(transcript_lines(turns, seed)) + "\n"
+
+
+def synthetic_jobs(daemon, count: int, start: int = 0, base_time: int = 1_700_000_000):
+    """Finished jobs with a few steps and a result, like a real history."""
+    rng = random.Random(start)
+    for i in range(start, start + count):
+        auto = rng.random() < 0.8
+        yield daemon.Job(
+            id=f"bench-{i}",
+            time=base_time + i,
+            prompt=f"Task {i}: " + "summarize the repository layout and open issues " * rng.randint(1, 4),
+            type="auto" if auto else "interactive",
+            status=daemon.JobStatus.COMPLETED,
+            result=("Result paragraph. " * rng.randint(5, 40)) if auto else None,
+            cost_usd=round(rng.random(), 4) if auto else None,
+            duration_ms=rng.randint(1000, 600000) if auto else None,
+            steps=[{"type": "tool_use" if s % 2 else "text", "content": f"step {s} " + "y" * 80}
+                   for s in range(rng.randint(2, 12))] if auto else None,
+        )
+
+
+def ntfy_message(i: int, base_time: int = 1_800_000_000) -> dict:
+    return {
+        "id": f"msg-{i}",
+        "time": base_time + i,
+        "event": "message",
+        "topic": "bench",
+        "message": json.dumps({"type": "auto", "prompt": f"Benchmark task {i}"}),
+    }
+
+
+# ── Fake ntfy server ────────────────────────────────────────────────────────
+
+
+def make_fake_ntfy(messages: int, rate: float, port: int = 0) -> http.server.ThreadingHTTPServer:
+    """A /<topic>/json endpoint that streams `messages` events, then keepalives.
+
+    ``rate`` is messages per second (0 = as fast as possible). ``since`` is
+    ignored, so reconnects replay everything and exercise dedup.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                self._write({"event": "open", "time": int(time.time())})
+                t0 = time.monotonic()
+                for i in range(messages):
+                    if rate > 0 and (wait := t0 + i / rate - time.monotonic()) > 0:
+                        time.sleep(wait)
+                    self._write(ntfy_message(i), flush=False)
+                self.wfile.flush()
+                while True:
+                    time.sleep(1)
+                    self._write({"event": "keepalive", "time": int(time.time())})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _write(self, event: dict, flush: bool = True):
+            self.wfile.write(json.dumps(event).encode() + b"\n")
+            if flush:
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def fake_ntfy_main(argv: list[str]):
+    ap = argparse.ArgumentParser(prog="bench-ntfy-claude.py fake-ntfy")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--messages", type=int, default=1000)
+    ap.add_argument("--rate", type=float, default=0)
+    args = ap.parse_args(argv)
+    server = make_fake_ntfy(args.messages, args.rate, args.port)
+    print(f"fake ntfy on http://127.0.0.1:{args.port} (any topic)", file=sys.stderr)
+    server.serve_forever()
+
+
+# ── Fake claude ─────────────────────────────────────────────────────────────
+
+
+def fake_claude_main(argv: list[str]):
+    """Stand-in for `claude -p ... --output-format stream-json`.
+
+    FAKE_CLAUDE_STARTUP (boot seconds), FAKE_CLAUDE_TURNS, FAKE_CLAUDE_DELAY
+    (seconds per turn) and FAKE_CLAUDE_BODY_LINES shape the output. With
+    ``--input-format stream-json`` it answers each user message on stdin,
+    like a warm session; other arguments are ignored.
+    """
+    turns = int(os.environ.get("FAKE_CLAUDE_TURNS", "20"))
+    delay = float(os.environ.get("FAKE_CLAUDE_DELAY", "0"))
+    body_lines = int(os.environ.get("FAKE_CLAUDE_BODY_LINES", "40"))
+    time.sleep(float(os.environ.get("FAKE_CLAUDE_STARTUP", "0")))
+    out = sys.stdout
+
+    def answer(seed: int):
+        for line in transcript_lines(turns, seed=seed, max_body_lines=body_lines):
+            out.write(line + "\n")
+            if delay and line.startswith('{"type": "user"'):
+                out.flush()
+                time.sleep(delay)
+        out.flush()
+
+    if "--input-format" in argv:
+        for n, line in enumerate(sys.stdin):
+            if line.strip():
+                answer(n)
+    else:
+        answer(hash(tuple(argv)) & 0xFFFF)
+
+
+def write_claude_shim(directory: Path) -> Path:
+    shim = directory / "claude"
+    shim.write_text(f'#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(str(Path(__file__).resolve()))} '
+                    f'fake-claude "$@"\n')
+    shim.chmod(0o755)
+    return directory
+
+
+# ── Scenarios (each runs in its own process) ────────────────────────────────
+
+
+def scenario_seed(p: dict) -> dict:
+    daemon = load_daemon()
+    t0 = time.perf_counter()
+    store = daemon.open_job_store()
+    batch: list = []
+    for job in synthetic_jobs(daemon, p["size"]):
+        batch.append(job)
+        if len(batch) == 1000:
+            store.add_many(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+    store.sync()
+    store.close()
+    return {"seed_s": round(time.perf_counter() - t0, 4), "seed_peak_rss_mib": peak_rss_mib()}
+
+
+def scenario_store(p: dict) -> dict:
+    daemon = load_daemon()
+    samples = p.get("samples", 200)
+    t0 = time.perf_counter()
+    store = daemon.open_job_store()
+    open_s = time.perf_counter() - t0
+    open_rss = peak_rss_mib()
+
+    def timed(fn, items) -> list[float]:
+        out = []
+        for item in items:
+            t = time.perf_counter()
+            fn(item)
+            out.append(time.perf_counter() - t)
+        return out
+
+    new_jobs = list(synthetic_jobs(daemon, samples, start=p["size"]))
+    for job in new_jobs:
+        job.status, job.steps, job.result = daemon.JobStatus.PENDING, None, None
+    add = timed(store.add, new_jobs)
+
+    def run_job(job):
+        # What a running auto job does: a few step flushes, then the result
+        job.status = daemon.JobStatus.RUNNING
+        job.steps = [{"type": "text", "content": "step " + "z" * 80}]
+        store.update(job)
+
+    update = timed(run_job, new_jobs)
+    page = timed(lambda _: store.page(limit=daemon.JOB_PAGE_SIZE), range(samples))
+    rng = random.Random(1)
+    get = timed(lambda i: store.get(f"bench-{i}"), [rng.randrange(p["size"]) for _ in range(samples)])
+    sync = timed(lambda _: store.sync(), range(20))
+    store.close()
+    metrics = {"open_s": round(open_s, 4), "open_peak_rss_mib": open_rss}
+    for name, values in (("add", add), ("update", update), ("page", page), ("get", get), ("sync", sync)):
+        metrics.update({f"{name}_{k}": v for k, v in percentiles_ms(values).items()})
+    metrics["peak_rss_mib"] = peak_rss_mib()
+    return metrics
+
+
+def scenario_search(p: dict) -> dict:
+    daemon = load_daemon()
+    samples = p.get("samples", 100)
+    store = daemon.open_job_store()
+    index = daemon.JobSearchIndex()
+    t0 = time.perf_counter()
+    indexed = index.catch_up(store)
+    build_s = time.perf_counter() - t0
+
+    def timed(queries: list[str], offset: int = 0) -> list[float]:
+        out = []
+        for q in queries:
+            t = time.perf_counter()
+            index.search(q, offset)
+            out.append(time.perf_counter() - t)
+        return out
+
+    rng = random.Random(2)
+    # One job each, vs. terms in most of the history (ranked over the window)
+    rare = timed([f"Task {rng.randrange(p['size'])}:" for _ in range(samples)])
+    common = ["summarize repository", "Result paragraph", "open issues", "step 3"]
+    common_first = timed([common[i % len(common)] for i in range(samples)])
+    common_next = timed([common[-1]] * samples, offset=daemon.SEARCH_PAGE_SIZE)
+    index.close()
+    store.close()
+    metrics = {"indexed": indexed, "build_s": round(build_s, 4)}
+    for name, values in (("rare", rare), ("common", common_first), ("next_page", common_next)):
+        metrics.update({f"{name}_{k}": v for k, v in percentiles_ms(values).items()})
+    metrics["peak_rss_mib"] = peak_rss_mib()
+    return metrics
+
+
+def run_app(daemon, body, setup=None, size=(120, 40)) -> dict:
+    import asyncio
+
+    async def main():
+        t0 = time.perf_counter()
+        app = daemon.NtfyClaudeApp()
+        if setup:
+            setup(app)
+        async with app.run_test(size=size) as pilot:
+            # The store opens in a thread after the first frame
+            while app.store is None:
+                await asyncio.sleep(0.005)
+            await pilot.pause()
+            return await body(app, pilot, time.perf_counter() - t0)
+
+    return asyncio.run(main())
+
+
+def scenario_render(p: dict) -> dict:
+    daemon = load_daemon()
+    repeat = p.get("repeat", 5)
+
+    async def body(app, pilot, startup_s):
+        samples = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            app._refresh_job_list()
+            await pilot.pause()
+            samples.append(time.perf_counter() - t)
+        return {
+            "startup_s": round(startup_s, 4),
+            "refresh_min_s": round(min(samples), 4),
+            "refresh_median_s": round(statistics.median(samples), 4),
+            "virtual": app._virtual,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+    return run_app(daemon, body)
+
+
+def scenario_ingest(p: dict) -> dict:
+    import asyncio
+
+    daemon = load_daemon()
+    expected = p["size"] + p["messages"]
+
+    connected_at: list[float] = []
+
+    def setup(app):
+        # Ingest only: keep auto jobs pending instead of spawning claude
+        for scheduler in app.schedulers.values():
+            scheduler.submit = lambda job: None
+        set_connected = app._set_connected
+
+        def on_connected(sub):
+            connected_at.append(time.perf_counter())
+            set_connected(sub)
+
+        app._set_connected = on_connected
+
+    async def body(app, pilot, startup_s):
+        deadline = time.monotonic() + RUN_TIMEOUT
+        while app.store.count() < expected:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"ingested {app.store.count()} of {expected}")
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - connected_at[0]
+        await pilot.pause()
+        return {
+            "ingest_s": round(elapsed, 4),
+            "messages_per_s": round(p["messages"] / elapsed, 1) if elapsed else None,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+    return run_app(daemon, body, setup)
+
+
+def scenario_jobs(p: dict) -> dict:
+    import asyncio
+
+    daemon = load_daemon()
+    count = p["jobs"]
+    done = {daemon.JobStatus.COMPLETED, daemon.JobStatus.FAILED}
+
+    async def body(app, pilot, startup_s):
+        if app.pool:
+            # Let the warm sessions boot, as they would long before a job arrives
+            while app.pool.idle < app.pool.size:
+                await asyncio.sleep(0.01)
+        t0 = time.perf_counter()
+        for i in range(count):
+            app._ingest_queue.put((app.subscriptions[0].label, json.dumps(ntfy_message(i))))
+        deadline = time.monotonic() + RUN_TIMEOUT
+        while True:
+            headers = app.store.page(limit=count, type="auto")
+            if len(headers) == count and all(h.status in done for h in headers):
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError("auto jobs did not finish")
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - t0
+        failed = sum(h.status == daemon.JobStatus.FAILED for h in headers)
+        steps = len(app.store.get(headers[0].id).steps or [])
+        first = daemon.FIRST_STEP.summary()
+        await pilot.pause()
+        return {
+            "first_step_p50_s": round(first.get("p50", 0), 4),
+            "first_step_p95_s": round(first.get("p95", 0), 4),
+            "total_s": round(elapsed, 4),
+            "jobs_per_s": round(count / elapsed, 2),
+            "failed": failed,
+            "steps_per_job": steps,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+    return run_app(daemon, body)
+
+
+def scenario_startup(p: dict) -> dict:
+    import asyncio
+
+    t0 = time.perf_counter()
+    daemon = load_daemon()
+    import_s = time.perf_counter() - t0
+    snapshot_rows = len(daemon.load_snapshot())
+    connected_at: list[float] = []
+
+    def setup(app):
+        set_connected = app._set_connected
+
+        def on_connected(sub):
+            connected_at.append(time.perf_counter() - t0)
+            set_connected(sub)
+
+        app._set_connected = on_connected
+
+    async def body(app, pilot, startup_s):
+        deadline = time.monotonic() + RUN_TIMEOUT
+        while not connected_at or "first_frame" not in app.startup:
+            if time.monotonic() > deadline:
+                raise TimeoutError("no first frame or connection")
+            await asyncio.sleep(0.005)
+        return {
+            "import_s": round(import_s, 4),
+            # The app times its phases from the end of the imports
+            "first_frame_s": round(import_s + app.startup["first_frame"], 4),
+            "store_ready_s": round(import_s + app.startup["store_ready"], 4),
+            "connected_s": round(connected_at[0], 4),
+            "snapshot_rows": snapshot_rows,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+    return run_app(daemon, body, setup)
+
+
+SCENARIOS = {
+    "seed": scenario_seed,
+    "store": scenario_store,
+    "render": scenario_render,
+    "ingest": scenario_ingest,
+    "jobs": scenario_jobs,
+    "startup": scenario_startup,
+    "search": scenario_search,
+}
+
+
+def run_scenario_main(argv: list[str]):
+    name, params, out = argv
+    result = SCENARIOS[name](json.loads(params))
+    Path(out).write_text(json.dumps(result))
+
+
+# ── Orchestration ───────────────────────────────────────────────────────────
+
+
+class Runner:
+    """Runs scenarios in subprocesses against throwaway data dirs."""
+
+    def __init__(self, workdir: Path):
+        self.workdir = workdir
+        self._seeds: dict[tuple[str, int], tuple[Path, dict]] = {}
+        self._n = 0
+
+    def spawn(self, name: str, params: dict, data_dir: Path, env: dict | None = None) -> dict:
+        out = self.workdir / f"result-{self._n}.json"
+        self._n += 1
+        full_env = {**os.environ, "NTFY_CLAUDE_DATA_DIR": str(data_dir),
+                    "NTFY_SERVER": "http://127.0.0.1:9", "NTFY_TOPIC": "bench",
+                    "NTFY_CLAUDE_DIR": str(self.workdir), "NTFY_CLAUDE_METRICS_PORT": "0",
+                    **(env or {})}
+        proc = subprocess.run(
+            [sys.executable, __file__, "_run", name, json.dumps(params), str(out)],
+            env=full_env, capture_output=True, text=True, timeout=RUN_TIMEOUT,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"{name} {params} failed:\n{proc.stderr[-4000:]}")
+        return json.loads(out.read_text())
+
+    def seeded(self, engine: str, size: int) -> tuple[Path, dict]:
+        """A data dir holding `size` jobs (seeded once, copied per use)."""
+        key = (engine, size)
+        if key not in self._seeds:
+            seed_dir = self.workdir / f"seed-{engine}-{size}"
+            seed_dir.mkdir()
+            metrics = self.spawn("seed", {"size": size}, seed_dir, {"NTFY_CLAUDE_STORE": engine})
+            self._seeds[key] = (seed_dir, metrics)
+        seed_dir, metrics = self._seeds[key]
+        data_dir = self.workdir / f"data-{self._n}"
+        shutil.copytree(seed_dir, data_dir)
+        return data_dir, metrics
+
+    def record(self, benchmark: str, params: dict, metrics: dict) -> dict:
+        rec = {"benchmark": benchmark, "params": params, "metrics": metrics}
+        print(json.dumps(rec), file=sys.stderr)
+        return rec
+
+    def store(self, sizes: list[int], engines: list[str]) -> list[dict]:
+        out = []
+        for engine in engines:
+            for size in sizes:
+                data_dir, seed = self.seeded(engine, size)
+                metrics = self.spawn("store", {"size": size}, data_dir, {"NTFY_CLAUDE_STORE": engine})
+                out.append(self.record("store", {"engine": engine, "size": size}, {**seed, **metrics}))
+        return out
+
+    def render(self, sizes: list[int], engines: list[str]) -> list[dict]:
+        out = []
+        for engine in engines:
+            for size in sizes:
+                for mode in ("list", "virtual"):
+                    data_dir, _ = self.seeded(engine, size)
+                    metrics = self.spawn("render", {"size": size}, data_dir,
+                                         {"NTFY_CLAUDE_STORE": engine, "NTFY_CLAUDE_LIST_MODE": mode})
+                    out.append(self.record("render", {"engine": engine, "size": size, "mode": mode}, metrics))
+        return out
+
+    def ingest(self, sizes: list[int], engines: list[str], messages: int, rate: float) -> list[dict]:
+        out = []
+        for engine in engines:
+            for size in sizes:
+                data_dir, _ = self.seeded(engine, size)
+                server = make_fake_ntfy(messages, rate)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                try:
+                    metrics = self.spawn(
+                        "ingest", {"size": size, "messages": messages}, data_dir,
+                        {"NTFY_CLAUDE_STORE": engine, "NTFY_SERVER": f"http://127.0.0.1:{server.server_port}"},
+                    )
+                finally:
+                    server.shutdown()
+                    server.server_close()
+                params = {"engine": engine, "size": size, "messages": messages, "rate": rate}
+                out.append(self.record("ingest", params, metrics))
+        return out
+
+    def startup(self, sizes: list[int], engines: list[str]) -> list[dict]:
+        out = []
+        server = make_fake_ntfy(0, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env = {"NTFY_SERVER": f"http://127.0.0.1:{server.server_port}"}
+        try:
+            for engine in engines:
+                for size in sizes:
+                    data_dir, _ = self.seeded(engine, size)
+                    # The first run has no snapshot yet and leaves one behind
+                    for snapshot in (False, True):
+                        metrics = self.spawn("startup", {"size": size}, data_dir, {**env, "NTFY_CLAUDE_STORE": engine})
+                        params = {"engine": engine, "size": size, "snapshot": snapshot}
+                        out.append(self.record("startup", params, metrics))
+        finally:
+            server.shutdown()
+            server.server_close()
+        return out
+
+    def search(self, sizes: list[int], engines: list[str]) -> list[dict]:
+        out = []
+        for engine in engines:
+            for size in sizes:
+                data_dir, _ = self.seeded(engine, size)
+                metrics = self.spawn("search", {"size": size}, data_dir, {"NTFY_CLAUDE_STORE": engine})
+                out.append(self.record("search", {"engine": engine, "size": size}, metrics))
+        return out
+
+    def jobs(self, jobs: int, concurrency: int, turns: int, delay: float, startup: float,
+             pools: list[int]) -> list[dict]:
+        shim_dir = write_claude_shim(Path(tempfile.mkdtemp(dir=self.workdir)))
+        out = []
+        for pool in pools:
+            data_dir = self.workdir / f"data-{self._n}"
+            data_dir.mkdir()
+            metrics = self.spawn("jobs", {"jobs": jobs, "startup": startup}, data_dir, {
+                "PATH": f"{shim_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+                "NTFY_CLAUDE_MAX_CONCURRENCY": str(concurrency),
+                "NTFY_CLAUDE_POOL_SIZE": str(pool),
+                "FAKE_CLAUDE_TURNS": str(turns),
+                "FAKE_CLAUDE_DELAY": str(delay),
+                "FAKE_CLAUDE_STARTUP": str(startup),
+                # The fake prints nothing before its first prompt, like claude;
+                # allow for the shim's own interpreter start on top of the boot
+                "NTFY_CLAUDE_POOL_WARMUP": str(startup + 1.0),
+            })
+            params = {"jobs": jobs, "concurrency": concurrency, "turns": turns, "delay": delay,
+                      "startup": startup, "pool": pool}
+            out.append(self.record("jobs", params, metrics))
+        return out
+
+
+def bench_parser(paths: list[str], repeat: int = 5) -> list[dict]:
+    daemon = load_daemon()
+    if paths:
+        corpus = [(p, Path(p).read_text(encoding="utf-8", errors="replace")) for p in paths]
+    else:
+        corpus = [("synthetic", synthetic_transcript())]
+    results = []
+    for name, text in corpus:
+        raw = text.encode()
+        if legacy_parse_stream_json(text) != daemon.parse_stream_json(raw):
+            raise SystemExit(f"{name}: parser output differs from the reference parser")
+        legacy = best_of(lambda: legacy_parse_stream_json(text), repeat)
+        current = best_of(lambda: daemon.parse_stream_json(raw), repeat)
+        results.append({"benchmark": "parser", "params": {"transcript": name}, "metrics": {
+            "bytes": len(raw),
+            "lines": text.count("\n"),
+            "legacy_s": round(legacy, 6),
+            "current_s": round(current, 6),
+            "speedup": round(legacy / current, 2) if current else None,
+        }})
+    return results
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DAEMON.parent,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        backend = load_daemon().JSON_BACKEND
+    except Exception:
+        backend = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": backend,
+    }
+
+
+# ── compare ─────────────────────────────────────────────────────────────────
+
+
+def regressed(metric: str, base: float, new: float, threshold: float) -> bool:
+    if not base:
+        return False
+    change = (new - base) / base
+    if metric.endswith(("_per_s", "speedup")):
+        return change < -threshold
+    if metric.endswith(("_s", "_ms", "_mib")):
+        return change > threshold
+    return False
+
+
+def compare_main(argv: list[str]):
+    ap = argparse.ArgumentParser(prog="bench-ntfy-claude.py compare")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = ap.parse_args(argv)
+
+    def index(path: str) -> dict:
+        data = json.loads(Path(path).read_text())
+        return {(r["benchmark"], json.dumps(r["params"], sort_keys=True)): r["metrics"] for r in data["results"]}
+
+    base, new = index(args.base), index(args.new)
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        print(f"{key[0]} {key[1]}")
+        for metric, old in base[key].items():
+            cur = new[key].get(metric)
+            if not isinstance(old, (int, float)) or isinstance(old, bool) or not isinstance(cur, (int, float)):
+                continue
+            change = f"{(cur - old) / old:+.1%}" if old else "n/a"
+            flag = ""
+            if regressed(metric, old, cur, args.threshold):
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"  {metric:<24} {old:>12} → {cur:<12} {change}{flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+# ── CLI ─────────────────────────────────────────────────────────────────────
+
+
+def main():
+    argv = sys.argv[1:]
+    internal = {"_run": run_scenario_main, "fake-claude": fake_claude_main,
+                "fake-ntfy": fake_ntfy_main, "compare": compare_main}
+    if argv and argv[0] in internal:
+        internal[argv[0]](argv[1:])
+        return
+
+    ap = argparse.ArgumentParser(prog="bench-ntfy-claude.py", usage=__doc__.split("\n\n")[1].removeprefix("Usage:\n"))
+    ap.add_argument("benchmark", choices=["all", "parser", "store", "render", "ingest", "jobs", "startup", "search"])
+    ap.add_argument("transcripts", nargs="*", help="recorded stream-json files (parser)")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="job counts in the store")
+    ap.add_argument("--engines", default="sqlite,jsonl")
+    ap.add_argument("--messages", type=int, default=2000, help="ingest: messages sent by the fake ntfy server")
+    ap.add_argument("--rate", type=float, default=0, help="ingest: messages per second (0 = unthrottled)")
+    ap.add_argument("--jobs", type=int, default=50, help="jobs: auto jobs to run")
+    ap.add_argument("--concurrency", type=int, default=3)
+    ap.add_argument("--turns", type=int, default=20, help="jobs: assistant turns per fake claude run")
+    ap.add_argument("--delay", type=float, default=0.0, help="jobs: seconds per fake claude turn")
+    ap.add_argument("--startup", type=float, default=1.0, help="jobs: fake claude boot seconds")
+    ap.add_argument("--pools", default="0,3", help="jobs: warm pool sizes to compare")
+    ap.add_argument("--out", help="write results JSON here as well as stdout")
+    args = ap.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    engines = [e for e in args.engines.split(",") if e]
+    which = {"parser", "store", "render", "ingest", "jobs", "startup", "search"} if args.benchmark == "all" else {args.benchmark}
+    results: list[dict] = []
+    with tempfile.TemporaryDirectory(prefix="ntfy-claude-bench-") as tmp:
+        runner = Runner(Path(tmp))
+        if "parser" in which:
+            results += bench_parser(args.transcripts)
+        if "store" in which:
+            results += runner.store(sizes, engines)
+        if "render" in which:
+            results += runner.render(sizes, engines)
+        if "ingest" in which:
+            results += runner.ingest(sizes, engines, args.messages, args.rate)
+        if "jobs" in which:
+            pools = [int(p) for p in args.pools.split(",") if p]
+            results += runner.jobs(args.jobs, args.concurrency, args.turns, args.delay, args.startup, pools)
+        if "startup" in which:
+            results += runner.startup(sizes, engines)
+        if "search" in which:
+            results += runner.search(sizes, engines)
+
+    report = json.dumps({"environment": environment(), "results": results}, indent=2)
+    if args.out:
+        Path(args.out).write_text(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
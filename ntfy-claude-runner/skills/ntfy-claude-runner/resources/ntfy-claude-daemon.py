@@ -3,7 +3,8 @@
 # requires-python = ">=3.11"
 # dependencies = [
 #   "textual>=1.0",
-#   "httpx",
+#   "httpx[http2]",
+#   "orjson",
 #   "sh>=2.0",
 # ]
 # ///
@@ -12,6 +13,8 @@
 Usage:
     uv run ntfy-claude-daemon.py                          # default topic
     NTFY_TOPIC=my-secret-topic uv run ntfy-claude-daemon.py
+    NTFY_TOPICS="team-a=topic-a:2,team-b=https://ntfy.example.com/topic-b" uv run ntfy-claude-daemon.py
+    NTFY_CLAUDE_DB=/shared/jobs.db uv run ntfy-claude-daemon.py --worker   # headless worker
 
 Message format (plain text → interactive):
     curl -d "Fix the auth bug" ntfy.sh/my-claude-tasks
@@ -22,255 +25,3085 @@ Message format (JSON → auto/interactive):
 
 from __future__ import annotations
 
+import abc
+import asyncio
+import bisect
+import gzip
+import hashlib
+import heapq
+import importlib.util
+import itertools
 import json
+import math
 import os
-import subprocess
+import queue
+import signal
+import socket
+import sqlite3
+import sys
+import threading
 import time
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, contextmanager
 from dataclasses import asdict, dataclass
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
 
-import httpx
-import sh
-from textual import work
+from rich.markup import escape
+from rich.table import Table
+from rich.text import Text
+from textual import events, work
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import VerticalScroll
-from textual.screen import Screen
+from textual.geometry import Size
+from textual.message import Message
+from textual.screen import ModalScreen, Screen
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
 from textual.widgets import (
     Footer,
     Header,
+    Input,
     Label,
     ListItem,
     ListView,
-    Markdown,
     Static,
 )
+from textual.worker import Worker, get_current_worker
+
+# httpx, sh and markdown-it (with Textual's Markdown widget) are imported
+# where first used: together they are over a third of the import time, and none
+# of them is needed for the first frame
+if TYPE_CHECKING:
+    import httpx
+    from textual.widgets import Markdown
+
+# Startup phases are timed from here; `bench-ntfy-claude.py startup` adds the
+# import time measured around loading the module
+_STARTED = time.perf_counter()
 
 # ── Config ───────────────────────────────────────────────────────────────────
 
 NTFY_SERVER = os.environ.get("NTFY_SERVER", "https://ntfy.sh")
 NTFY_TOPIC = os.environ.get("NTFY_TOPIC", "my-claude-tasks")
+# Several topics, possibly on other servers, in one daemon: comma-separated
+# "[label=]topic-or-url[:concurrency]" entries (overrides NTFY_SERVER/NTFY_TOPIC)
+NTFY_TOPICS = os.environ.get("NTFY_TOPICS", "")
+# Subscriber connection: ntfy sends a keepalive every ~45s, so a read timeout
+# above that doubles as heartbeat detection for silently dead streams
+NTFY_CONNECT_TIMEOUT = float(os.environ.get("NTFY_CONNECT_TIMEOUT", "10"))
+NTFY_READ_TIMEOUT = float(os.environ.get("NTFY_READ_TIMEOUT", "90"))
+NTFY_KEEPALIVE_EXPIRY = float(os.environ.get("NTFY_KEEPALIVE_EXPIRY", "300"))
+# A stream that stayed up this long is retried immediately when it drops
+NTFY_STABLE_SECS = 5.0
 ZELLIJ_SESSION = os.environ.get("ZELLIJ_SESSION", "main")
 CLAUDE_TIMEOUT = int(os.environ.get("CLAUDE_TIMEOUT", "600"))  # 10 min
+CLAUDE_MODEL = os.environ.get("NTFY_CLAUDE_MODEL", "sonnet")
+# Minimum seconds between live step updates of a running auto job
+STEP_FLUSH_INTERVAL = 0.5
+# Longest stream-json line read from claude (tool results can be large)
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+# Auto jobs allowed to run at once (per topic); the rest wait in the scheduler queue
+MAX_CONCURRENCY = int(os.environ.get("NTFY_CLAUDE_MAX_CONCURRENCY", "3"))
 # Working directory for auto tasks (should have settings.json for sandbox)
 NTFY_CLAUDE_DIR = Path(os.environ.get("NTFY_CLAUDE_DIR", Path.cwd()))
 
-DATA_DIR = Path.home() / ".local/share/ntfy-claude"
-STATE_FILE = DATA_DIR / "last-timestamp"
-JOBS_FILE = DATA_DIR / "jobs.jsonl"
+DATA_DIR = Path(os.environ.get("NTFY_CLAUDE_DATA_DIR", Path.home() / ".local/share/ntfy-claude"))
+STATE_FILE = DATA_DIR / "last-timestamp"
+# Per-topic cursors when NTFY_TOPICS is set
+CURSOR_DIR = DATA_DIR / "cursors"
+JOBS_FILE = DATA_DIR / "jobs.jsonl"
+JOBS_DB = Path(os.environ.get("NTFY_CLAUDE_DB", DATA_DIR / "jobs.db"))
+# WAL needs every process on one host; use DELETE for a database on a
+# volume shared between hosts
+SQLITE_JOURNAL_MODE = os.environ.get("NTFY_CLAUDE_SQLITE_JOURNAL", "WAL")
+# Seconds a store write waits for another connection's write lock. Short,
+# as job updates are written from the UI thread; they retry after
+# STORE_RETRY_DELAY instead
+SQLITE_BUSY_TIMEOUT = 2.0
+STORE_RETRY_DELAY = 1.0
+# Storage engine: "sqlite" (default) or "jsonl"
+STORE_ENGINE = os.environ.get("NTFY_CLAUDE_STORE", "sqlite")
+# Rows loaded into the job list at a time
+JOB_PAGE_SIZE = int(os.environ.get("NTFY_CLAUDE_PAGE_SIZE", "200"))
+# Characters of the prompt kept in list-view headers
+PROMPT_PREVIEW_LEN = 80
+# Job list mode: "list" mounts a row widget per job, "virtual" renders only the
+# visible rows; "auto" switches to virtual above VIRTUAL_LIST_THRESHOLD jobs
+LIST_MODE = os.environ.get("NTFY_CLAUDE_LIST_MODE", "auto")
+VIRTUAL_LIST_THRESHOLD = int(os.environ.get("NTFY_CLAUDE_VIRTUAL_THRESHOLD", "1000"))
+
+
+# ── Data Model ───────────────────────────────────────────────────────────────
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    time: int
+    prompt: str
+    type: str  # "auto" | "interactive"
+    status: JobStatus = JobStatus.PENDING
+    result: str | None = None
+    cost_usd: float | None = None
+    duration_ms: int | None = None
+    error: str | None = None
+    steps: list[dict] | None = None  # [{"type": "text"|"tool_use", "content": "..."}]
+    priority: int = 0  # higher runs first
+    cached: bool = False  # result served from the result cache
+    cache_policy: str | None = None  # None | "bypass" | "refresh" (payload flags)
+    peak_rss_mb: float | None = None  # claude's peak resident memory
+    cpu_seconds: float | None = None  # claude's user+system CPU time
+    topic: str | None = None  # label of the subscription it arrived on
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["status"] = self.status.value
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> Job:
+        d = dict(d)
+        d["status"] = JobStatus(d["status"])
+        # Drop unknown keys for forward compat
+        from dataclasses import fields as _fields
+        known = {f.name for f in _fields(cls)}
+        return cls(**{k: v for k, v in d.items() if k in known})
+
+
+class JobHeader:
+    """The list-view slice of a job: no steps, result or full prompt."""
+
+    __slots__ = ("id", "time", "type", "status", "preview")
+
+    def __init__(self, id: str, time: int, type: str, status: JobStatus, preview: str):
+        self.id = id
+        self.time = time
+        self.type = type
+        self.status = status
+        self.preview = preview
+
+    @classmethod
+    def of(cls, job: Job) -> JobHeader:
+        return cls(job.id, job.time, job.type, job.status, job.prompt[:PROMPT_PREVIEW_LEN])
+
+    @classmethod
+    def from_dict(cls, d: dict) -> JobHeader:
+        return cls(d["id"], d["time"], d["type"], JobStatus(d["status"]), d["prompt"][:PROMPT_PREVIEW_LEN])
+
+    def apply(self, patch: dict):
+        """Apply the header fields of a JSONL patch record."""
+        if "status" in patch:
+            self.status = JobStatus(patch["status"])
+        if "prompt" in patch:
+            self.preview = patch["prompt"][:PROMPT_PREVIEW_LEN]
+        if "time" in patch:
+            self.time = patch["time"]
+        if "type" in patch:
+            self.type = patch["type"]
+
+
+# ── Job Store (append-only JSONL) ────────────────────────────────────────────
+
+# Compact once superseded records make up half the log (and at least this much)
+COMPACT_MIN_BYTES = 1 << 20
+
+
+def _field_digests(d: dict) -> dict[str, int]:
+    """Hash each serialized field so updates can be diffed without a full copy."""
+    return {k: hash(json.dumps(v, ensure_ascii=False, sort_keys=True)) for k, v in d.items()}
+
+
+class JobStore(abc.ABC):
+    """Storage interface shared by the JSONL and SQLite engines.
+
+    Listing methods return ``JobHeader`` rows sorted by time descending;
+    ``type`` and ``status`` filter the result, ``offset``/``limit`` page
+    through it. ``get`` loads the full job, including steps and result.
+    """
+
+    @abc.abstractmethod
+    def add(self, job: Job):
+        ...
+
+    def add_many(self, jobs: list[Job]):
+        for job in jobs:
+            self.add(job)
+
+    @abc.abstractmethod
+    def update(self, job: Job):
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Job | None:
+        ...
+
+    @abc.abstractmethod
+    def has(self, job_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def page(
+        self,
+        offset: int = 0,
+        limit: int | None = None,
+        type: str | None = None,
+        status: JobStatus | None = None,
+    ) -> list[JobHeader]:
+        ...
+
+    @abc.abstractmethod
+    def count(self, type: str | None = None, status: JobStatus | None = None) -> int:
+        ...
+
+    @abc.abstractmethod
+    def rank(self, time: int) -> int:
+        """Number of jobs newer than ``time``, i.e. the list index of that moment."""
+        ...
+
+    def headers(self, ids: list[str]) -> list[JobHeader]:
+        """Headers of the given jobs that exist, in no particular order."""
+        return [JobHeader.of(job) for job_id in ids if (job := self.get(job_id))]
+
+    @abc.abstractmethod
+    def remove(self, job_ids: list[str]):
+        """Drop jobs from the store (retention moves them to the archive first)."""
+        ...
+
+    @abc.abstractmethod
+    def stored_bytes(self) -> int:
+        """Bytes the live history occupies on disk."""
+        ...
+
+    def sync(self):
+        """Make everything written so far durable on disk."""
+
+    def close(self):
+        pass
+
+    def all_auto(self) -> list[JobHeader]:
+        """Return auto jobs sorted by time descending."""
+        return self.page(type="auto")
+
+    def all_jobs(self) -> list[JobHeader]:
+        """Return all jobs sorted by time descending."""
+        return self.page()
+
+
+class JsonlJobStore(JobStore):
+    """Append-only JSONL job log.
+
+    A line is either a full job record or a patch ``{"id": ..., "patch": {...}}``
+    holding only the fields that changed (plus ``"append_steps"`` for steps
+    added since the last write), so a write costs the size of the
+    change rather than the size of the history. Once superseded lines make up
+    half the file, a background thread folds them back into one record per job.
+
+    Only headers live in memory; ``get`` rebuilds a full job by reading its
+    lines through the id -> offset index.
+    """
+
+    def __init__(self, path: Path = JOBS_FILE):
+        self._path = path
+        self._headers: dict[str, JobHeader] = {}
+        # id -> byte offsets of the base record and its patches
+        self._offsets: dict[str, list[int]] = {}
+        # id -> field -> digest of the last persisted value (jobs updated this session)
+        self._written: dict[str, dict[str, int]] = {}
+        self._step_counts: dict[str, int] = {}
+        self._size = 0
+        self._garbage = 0
+        self._compacting = False
+        self._compact_again = False
+        self._lock = threading.RLock()
+        self._load()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self._path, "ab")
+
+    def _load(self):
+        if not self._path.exists():
+            return
+        offset = 0
+        with open(self._path, "rb") as f:
+            for raw in f:
+                size = len(raw)
+                try:
+                    rec = json.loads(raw)
+                    job_id = rec["id"]
+                    if rec.get("removed"):
+                        self._headers.pop(job_id, None)
+                        self._offsets.pop(job_id, None)
+                        self._garbage += size
+                    elif "patch" in rec:
+                        if job_id in self._headers:
+                            self._headers[job_id].apply(rec["patch"])
+                            self._offsets[job_id].append(offset)
+                        self._garbage += size
+                    else:
+                        if job_id in self._headers:
+                            self._garbage += size
+                        self._headers[job_id] = JobHeader.from_dict(rec)
+                        self._offsets[job_id] = [offset]
+                except (json.JSONDecodeError, TypeError, KeyError, ValueError):
+                    pass
+                offset += size
+        self._size = offset
+
+    def _read(self, offsets: list[int]) -> dict | None:
+        """Fold the base record and patches at ``offsets`` into one dict."""
+        d: dict | None = None
+        with open(self._path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                rec = json.loads(f.readline())
+                if "patch" in rec:
+                    if d is not None:
+                        d.update(rec["patch"])
+                        if "append_steps" in rec:
+                            d["steps"] = (d.get("steps") or []) + rec["append_steps"]
+                else:
+                    d = rec
+        return d
+
+    def _append(self, job_id: str, rec: dict, flush: bool = True) -> int:
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode()
+        self._offsets.setdefault(job_id, []).append(self._size)
+        self._fh.write(line)
+        if flush:
+            self._fh.flush()
+        self._size += len(line)
+        return len(line)
+
+    def add(self, job: Job):
+        self.add_many([job])
+
+    def add_many(self, jobs: list[Job]):
+        """Append new jobs with a single flush (existing ids become updates)."""
+        with self._lock:
+            for job in jobs:
+                if job.id in self._headers:
+                    self.update(job)
+                    continue
+                d = job.to_dict()
+                self._headers[job.id] = JobHeader.of(job)
+                self._append(job.id, d, flush=False)
+                self._remember(job.id, d)
+            self._fh.flush()
+        self._maybe_compact()
+
+    def _remember(self, job_id: str, d: dict):
+        """Record what is persisted for ``job_id`` so the next update can be diffed."""
+        d = dict(d)
+        self._step_counts[job_id] = len(d.pop("steps") or [])
+        self._written[job_id] = _field_digests(d)
+
+    def update(self, job: Job):
+        with self._lock:
+            if job.id not in self._headers:
+                self.add(job)
+                return
+            if job.id not in self._written:
+                stored = self.get(job.id) or job
+                self._remember(stored.id, stored.to_dict())
+            d = job.to_dict()
+            steps = d.pop("steps") or []
+            digests = _field_digests(d)
+            written = self._written[job.id]
+            patch = {k: v for k, v in d.items() if written.get(k) != digests[k]}
+            rec: dict = {"id": job.id, "patch": patch}
+            # Steps only grow while a job runs, so append just the new ones
+            stored_steps = self._step_counts[job.id]
+            if len(steps) < stored_steps:
+                patch["steps"] = steps or None
+            elif len(steps) > stored_steps:
+                rec["append_steps"] = steps[stored_steps:]
+            self._headers[job.id] = JobHeader.of(job)
+            if not patch and "append_steps" not in rec:
+                return
+            self._garbage += self._append(job.id, rec)
+            self._written[job.id] = digests
+            self._step_counts[job.id] = len(steps)
+        self._maybe_compact()
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            offsets = self._offsets.get(job_id)
+            if not offsets:
+                return None
+            d = self._read(offsets)
+        try:
+            return Job.from_dict(d) if d else None
+        except (TypeError, KeyError, ValueError):
+            return None
+
+    def has(self, job_id: str) -> bool:
+        return job_id in self._headers
+
+    def _select(self, type: str | None, status: JobStatus | None) -> list[JobHeader]:
+        # Ingest, retention and search threads write while the UI reads
+        with self._lock:
+            return [
+                h for h in self._headers.values()
+                if (type is None or h.type == type) and (status is None or h.status == status)
+            ]
+
+    def page(self, offset=0, limit=None, type=None, status=None) -> list[JobHeader]:
+        headers = sorted(self._select(type, status), key=lambda h: h.time, reverse=True)
+        return headers[offset:] if limit is None else headers[offset:offset + limit]
+
+    def count(self, type=None, status=None) -> int:
+        if type is None and status is None:
+            return len(self._headers)
+        return len(self._select(type, status))
+
+    def rank(self, time: int) -> int:
+        with self._lock:
+            return sum(1 for h in self._headers.values() if h.time > time)
+
+    def headers(self, ids: list[str]) -> list[JobHeader]:
+        with self._lock:
+            return [h for job_id in ids if (h := self._headers.get(job_id))]
+
+    def remove(self, job_ids: list[str]):
+        """Tombstone the jobs, then compact them out of the log."""
+        with self._lock:
+            for job_id in job_ids:
+                if self._headers.pop(job_id, None) is None:
+                    continue
+                self._written.pop(job_id, None)
+                self._step_counts.pop(job_id, None)
+                self._garbage += self._append(job_id, {"id": job_id, "removed": True}, flush=False)
+                self._offsets.pop(job_id, None)
+            self._fh.flush()
+        self._maybe_compact(force=True)
+
+    def stored_bytes(self) -> int:
+        return self._size - self._garbage
+
+    def sync(self):
+        with self._lock:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+    # ── Compaction ───────────────────────────────────────────────────────
+
+    def _maybe_compact(self, force: bool = False):
+        with self._lock:
+            if self._compacting:
+                # Removals during a compaction need another pass
+                self._compact_again |= force
+                return
+            if not force and self._garbage < max(COMPACT_MIN_BYTES, self._size // 2):
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact, name="jobstore-compact", daemon=True).start()
+
+    def _compact(self):
+        """Rewrite the log as one record per job, off the calling thread.
+
+        Jobs present at ``mark`` are folded one at a time through a snapshot
+        of the offset index; records appended meanwhile are copied over
+        verbatim before the atomic swap.
+        """
+        tmp = self._path.with_name(self._path.name + ".compact")
+        try:
+            with self._lock:
+                mark = self._size
+                snapshot = {
+                    job_id: [o for o in offs if o < mark]
+                    for job_id, offs in self._offsets.items()
+                }
+            offsets: dict[str, list[int]] = {}
+            with open(tmp, "wb") as out:
+                for job_id, offs in snapshot.items():
+                    d = self._read(offs) if offs else None
+                    if d is None:
+                        continue
+                    offsets[job_id] = [out.tell()]
+                    out.write((json.dumps(d, ensure_ascii=False) + "\n").encode())
+                base = out.tell()
+
+            with self._lock:
+                with open(self._path, "rb") as src:
+                    src.seek(mark)
+                    tail = src.read()
+                with open(tmp, "ab") as out:
+                    out.write(tail)
+                for job_id, offs in self._offsets.items():
+                    moved = [o - mark + base for o in offs if o >= mark]
+                    if moved:
+                        offsets.setdefault(job_id, []).extend(moved)
+                self._fh.close()
+                try:
+                    os.replace(tmp, self._path)
+                finally:
+                    self._fh = open(self._path, "ab")
+                # Jobs removed while the snapshot was being folded stay gone
+                self._offsets = {k: v for k, v in offsets.items() if k in self._headers}
+                self._size = base + len(tail)
+                self._garbage = len(tail)
+        except (OSError, json.JSONDecodeError):
+            tmp.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._compacting = False
+                again, self._compact_again = self._compact_again, False
+            if again:
+                self._maybe_compact(force=True)
+
+
+# ── Job Store (SQLite) ───────────────────────────────────────────────────────
+
+SQLITE_SCHEMA_VERSION = 1
+
+# Headers, bodies and steps live in separate tables so listing queries never
+# touch transcript pages.
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id      TEXT PRIMARY KEY,
+    time    INTEGER NOT NULL,
+    type    TEXT NOT NULL,
+    status  TEXT NOT NULL,
+    preview TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_time ON jobs(time DESC);
+CREATE INDEX IF NOT EXISTS jobs_type_time ON jobs(type, time DESC);
+CREATE INDEX IF NOT EXISTS jobs_status_time ON jobs(status, time DESC);
+
+CREATE TABLE IF NOT EXISTS job_bodies (
+    id          TEXT PRIMARY KEY,
+    prompt      TEXT NOT NULL,
+    result      TEXT,
+    cost_usd    REAL,
+    duration_ms INTEGER,
+    error       TEXT,
+    priority    INTEGER NOT NULL DEFAULT 0,
+    cached      INTEGER NOT NULL DEFAULT 0,
+    cache_policy TEXT,
+    peak_rss_mb REAL,
+    cpu_seconds REAL,
+    topic       TEXT
+);
+
+CREATE TABLE IF NOT EXISTS job_steps (
+    job_id  TEXT NOT NULL,
+    idx     INTEGER NOT NULL,
+    type    TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteJobStore(JobStore):
+    """SQLite job store (WAL mode).
+
+    Nothing is held in memory: listing queries read only the indexed header
+    table with LIMIT/OFFSET, and bodies/steps are fetched by ``get``.
+    """
+
+    def __init__(self, path: Path = JOBS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        # Autocommit; the lock serializes access from Textual worker threads
+        self._db = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT
+        )
+        self._db.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._migrate()
+
+    def _migrate(self):
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SQLITE_SCHEMA_VERSION:
+            return
+        # Version 1 is the first schema, so anything older is a new database
+        with self._transaction() as db:
+            for stmt in _SQLITE_SCHEMA.split(";\n"):
+                if stmt.strip():
+                    db.execute(stmt)
+            db.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _write(self, db: sqlite3.Connection, job: Job):
+        db.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?)",
+            (job.id, job.time, job.type, job.status.value, job.prompt[:PROMPT_PREVIEW_LEN]),
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO job_bodies VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+            (job.id, job.prompt, job.result, job.cost_usd, job.duration_ms, job.error, job.priority,
+             job.cached, job.cache_policy, job.peak_rss_mb, job.cpu_seconds, job.topic),
+        )
+        # Steps grow while a job runs, so keep the stored prefix they still
+        # share and write the rest; a rerun replaces the list from step 0
+        steps = job.steps or []
+        rows = db.execute(
+            "SELECT type, content FROM job_steps WHERE job_id = ? ORDER BY idx", (job.id,)
+        ).fetchall()
+        stored = 0
+        for row, step in zip(rows, steps):
+            if row != (step["type"], step["content"]):
+                break
+            stored += 1
+        if stored < len(rows):
+            db.execute("DELETE FROM job_steps WHERE job_id = ? AND idx >= ?", (job.id, stored))
+        db.executemany(
+            "INSERT OR REPLACE INTO job_steps VALUES (?,?,?,?)",
+            [(job.id, i, s["type"], s["content"]) for i, s in enumerate(steps[stored:], stored)],
+        )
+
+    def add(self, job: Job):
+        self.add_many([job])
+
+    def add_many(self, jobs: list[Job]):
+        with self._transaction() as db:
+            for job in jobs:
+                self._write(db, job)
+
+    def update(self, job: Job):
+        self.add(job)
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT j.time, j.type, j.status, b.prompt, b.result, b.cost_usd, b.duration_ms,"
+                " b.error, b.priority, b.cached, b.cache_policy, b.peak_rss_mb, b.cpu_seconds,"
+                " b.topic FROM jobs AS j JOIN job_bodies AS b USING (id) WHERE j.id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            steps = self._db.execute(
+                "SELECT type, content FROM job_steps WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        time_, type_, status, prompt, result, cost, duration, error, priority, cached, policy, rss, cpu, topic = row
+        return Job(
+            id=job_id, time=time_, prompt=prompt, type=type_,
+            status=JobStatus(status), result=result, cost_usd=cost,
+            duration_ms=duration, error=error, priority=priority,
+            cached=bool(cached), cache_policy=policy, peak_rss_mb=rss, cpu_seconds=cpu,
+            topic=topic,
+            steps=[{"type": t, "content": c} for t, c in steps] or None,
+        )
+
+    def has(self, job_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    @staticmethod
+    def _where(type: str | None, status: JobStatus | None) -> tuple[str, list]:
+        clauses, params = [], []
+        if type is not None:
+            clauses.append("type = ?")
+            params.append(type)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status.value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def page(self, offset=0, limit=None, type=None, status=None) -> list[JobHeader]:
+        where, params = self._where(type, status)
+        sql = (
+            f"SELECT id, time, type, status, preview FROM jobs{where}"
+            " ORDER BY time DESC, id DESC LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._db.execute(sql, [*params, -1 if limit is None else limit, offset]).fetchall()
+        return [JobHeader(id_, t, ty, JobStatus(st), pv) for id_, t, ty, st, pv in rows]
+
+    def count(self, type=None, status=None) -> int:
+        where, params = self._where(type, status)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM jobs{where}", params).fetchone()[0]
+
+    def rank(self, time: int) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE time > ?", (time,)).fetchone()[0]
+
+    def headers(self, ids: list[str]) -> list[JobHeader]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, time, type, status, preview FROM jobs WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return [JobHeader(id_, t, ty, JobStatus(st), pv) for id_, t, ty, st, pv in rows]
+
+    def remove(self, job_ids: list[str]):
+        with self._transaction() as db:
+            for table, column in (("jobs", "id"), ("job_bodies", "id"), ("job_steps", "job_id")):
+                db.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(i,) for i in job_ids])
+
+    def stored_bytes(self) -> int:
+        # Pages of the job tables and their indexes only: the shared queue
+        # lives in the same file
+        with self._lock:
+            try:
+                return self._db.execute(
+                    "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE aggregate = TRUE AND name IN"
+                    " (SELECT name FROM sqlite_schema WHERE tbl_name IN ('jobs', 'job_bodies', 'job_steps'))"
+                ).fetchone()[0]
+            except sqlite3.OperationalError:
+                # SQLite built without the dbstat table: count the stored text
+                return self._db.execute(
+                    "SELECT (SELECT COALESCE(SUM(length(id) + length(preview) + 32), 0) FROM jobs)"
+                    " + (SELECT COALESCE(SUM(length(prompt) + COALESCE(length(result), 0)"
+                    "    + COALESCE(length(error), 0) + 64), 0) FROM job_bodies)"
+                    " + (SELECT COALESCE(SUM(length(content) + 32), 0) FROM job_steps)"
+                ).fetchone()[0]
+
+    def data_version(self) -> int:
+        """Changes whenever another connection (process) commits."""
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def sync(self):
+        # synchronous=NORMAL only fsyncs the WAL at checkpoints
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def migrate_jsonl(src: Path, store: SqliteJobStore, batch: int = 500) -> int:
+    """Copy a jobs.jsonl history into ``store`` and rename the source.
+
+    The source is kept as ``<name>.migrated`` so the migration runs once.
+    Returns the number of jobs imported.
+    """
+    log = JsonlJobStore(src)
+    imported = 0
+    pending: list[Job] = []
+    for header in log.page():
+        if job := log.get(header.id):
+            pending.append(job)
+        if len(pending) >= batch:
+            store.add_many(pending)
+            imported += len(pending)
+            pending = []
+    store.add_many(pending)
+    imported += len(pending)
+    log.close()
+    src.rename(src.with_name(src.name + ".migrated"))
+    return imported
+
+
+def open_job_store() -> JobStore:
+    """Open the configured storage engine, migrating jobs.jsonl on first use."""
+    if STORE_ENGINE == "jsonl":
+        return JsonlJobStore()
+    store = SqliteJobStore()
+    if JOBS_FILE.exists() and store.count() == 0:
+        migrate_jsonl(JOBS_FILE, store)
+    return store
+
+
+# ── Retention & archive ──────────────────────────────────────────────────────
+
+
+def parse_size(value: str) -> int:
+    """Bytes from "512M", "4G", "1048576"."""
+    value = value.strip().upper().removesuffix("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value or 0)
+
+
+# Limits on the hot history (0 = unlimited); finished jobs beyond them move
+# to compressed archive segments
+RETAIN_DAYS = float(os.environ.get("NTFY_CLAUDE_RETAIN_DAYS", "0"))
+RETAIN_JOBS = int(os.environ.get("NTFY_CLAUDE_RETAIN_JOBS", "0"))
+RETAIN_BYTES = parse_size(os.environ.get("NTFY_CLAUDE_RETAIN_BYTES", "0"))
+# Jobs younger than this stay hot, so ntfy replays (cached for 12h) still
+# dedup against the store
+RETAIN_MIN_AGE = 86400
+RETENTION_INTERVAL = 3600.0
+ARCHIVE_DIR = DATA_DIR / "archive"
+# "zstd" needs the zstandard package; gzip is always available
+ARCHIVE_CODEC = os.environ.get(
+    "NTFY_CLAUDE_ARCHIVE_CODEC", "zstd" if importlib.util.find_spec("zstandard") else "gzip"
+)
+ARCHIVE_BATCH = 500
+_ARCHIVE_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class RetentionPolicy:
+    """Picks the finished jobs that exceed the age, count or size limits."""
+
+    def __init__(self, max_days: float = RETAIN_DAYS, max_jobs: int = RETAIN_JOBS, max_bytes: int = RETAIN_BYTES):
+        self.max_days = max_days
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_days or self.max_jobs or self.max_bytes)
+
+    def select(self, store: JobStore, now: float | None = None) -> list[JobHeader]:
+        """Jobs to archive, oldest first. Pending and running jobs stay."""
+        now = time.time() if now is None else now
+        total = store.count()
+        if not total:
+            return []
+        # How many of the oldest jobs have to go to meet each limit, counted
+        # without loading the history
+        excess = 0
+        if self.max_days:
+            # Jobs older than the cutoff: all but those at or after it
+            excess = total - store.rank(math.ceil(now - self.max_days * 86400) - 1)
+        if self.max_jobs:
+            excess = max(excess, total - self.max_jobs)
+        if self.max_bytes and (size := store.stored_bytes()) > self.max_bytes:
+            excess = max(excess, math.ceil((size - self.max_bytes) / (size / total)))
+        excess = min(excess, total)
+        if excess <= 0:
+            return []
+        oldest = store.page(offset=total - excess, limit=excess)[::-1]
+        return [
+            h for h in oldest
+            if h.status in (JobStatus.COMPLETED, JobStatus.FAILED) and h.time < now - RETAIN_MIN_AGE
+        ]
+
+
+def _read_segment(path: Path):
+    if path.name.endswith(".zst"):
+        import zstandard
+
+        return zstandard.open(path, "rb")
+    return gzip.open(path, "rb")
+
+
+class JobArchive:
+    """Compressed JSONL segments of full jobs, one per retention batch.
+
+    Segment names carry the time range they cover
+    (``jobs-<oldest>-<newest>-<ns>.jsonl.gz``), so lookups skip segments by
+    name and only decompress the ones that can match.
+    """
+
+    def __init__(self, path: Path = ARCHIVE_DIR, codec: str = ARCHIVE_CODEC):
+        if codec not in _ARCHIVE_SUFFIXES:
+            raise ValueError(f"NTFY_CLAUDE_ARCHIVE_CODEC: unknown codec {codec!r}")
+        self._path = path
+        self._codec = codec
+
+    def write(self, jobs: list[Job]) -> Path:
+        self._path.mkdir(parents=True, exist_ok=True)
+        times = [job.time for job in jobs]
+        dest = self._path / f"jobs-{min(times)}-{max(times)}-{time.time_ns()}{_ARCHIVE_SUFFIXES[self._codec]}"
+        tmp = dest.with_name(dest.name + ".tmp")
+        with open(tmp, "wb") as raw:
+            if self._codec == "zstd":
+                import zstandard
+
+                f = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+            else:
+                f = gzip.GzipFile(fileobj=raw, mode="wb")
+            with f:
+                for job in jobs:
+                    f.write((json.dumps(job.to_dict(), ensure_ascii=False) + "\n").encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, dest)
+        return dest
+
+    def segments(self) -> list[tuple[int, int, Path]]:
+        """(oldest, newest, path) of each segment, newest first."""
+        found = []
+        for path in self._path.glob("jobs-*.jsonl.*"):
+            if not path.name.endswith(tuple(_ARCHIVE_SUFFIXES.values())):
+                continue
+            oldest, newest = path.name.split("-")[1:3]
+            found.append((int(oldest), int(newest), path))
+        return sorted(found, reverse=True)
+
+    def search(self, text: str = "", since: int = 0, until: int | None = None) -> Iterator[Job]:
+        """Archived jobs whose record contains ``text``, newest segment first."""
+        needle = text.casefold()
+        for oldest, newest, path in self.segments():
+            if newest < since or (until is not None and oldest > until):
+                continue
+            with _read_segment(path) as f:
+                for line in f:
+                    if needle and needle not in line.decode(errors="replace").casefold():
+                        continue
+                    job = Job.from_dict(json.loads(line))
+                    if job.time >= since and (until is None or job.time <= until):
+                        yield job
+
+
+def apply_retention(store: JobStore, archive: JobArchive, policy: RetentionPolicy,
+                    search: JobSearchIndex | None = None) -> int:
+    """Move the jobs ``policy`` selects into the archive; returns how many."""
+    expired = policy.select(store)
+    for start in range(0, len(expired), ARCHIVE_BATCH):
+        batch = [job for h in expired[start:start + ARCHIVE_BATCH] if (job := store.get(h.id))]
+        if batch:
+            # Durable in the archive before it leaves the store
+            archive.write(batch)
+            store.remove([job.id for job in batch])
+            if search:
+                search.remove([job.id for job in batch])
+    return len(expired)
+
+
+# ── Search index ─────────────────────────────────────────────────────────────
+
+# A database of its own, so indexing never holds jobs.db's write lock. The
+# sqlite engine keeps it next to jobs.db, where workers sharing that
+# directory update it too
+SEARCH_DB = (JOBS_DB.parent if STORE_ENGINE == "sqlite" else DATA_DIR) / "search.db"
+# Results fetched per page on the search screen
+SEARCH_PAGE_SIZE = 50
+# Matches ranked per query; a query matching more ranks only the newest
+# this many, which keeps common terms as fast as rare ones
+SEARCH_RANK_WINDOW = 2000
+# Rank weight of a match in each indexed column
+SEARCH_WEIGHTS = {"prompt": 4, "result": 2, "steps": 1}
+# Characters of context shown around the first hit
+SNIPPET_CONTEXT = 30
+# Typing pause before a query runs
+SEARCH_DEBOUNCE = 0.15
+# Jobs, and bytes of text, indexed per transaction when catching up with
+# the store; searches wait for the transaction in progress
+SEARCH_BATCH = 500
+SEARCH_BATCH_BYTES = 4 * 1024 * 1024
+
+# Trigram tokens match substrings, so prompts without spaces (Japanese)
+# are searchable too. The trigram tokenizer needs SQLite 3.34+
+_SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    doc    INTEGER PRIMARY KEY,
+    id     TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_text USING fts5(prompt, result, steps, tokenize = 'trigram')
+"""
+
+
+def search_terms(text: str) -> list[str]:
+    # Trigrams can't match terms under three characters
+    return [t for t in text.split() if len(t) >= 3]
+
+
+def search_query(text: str) -> str | None:
+    """FTS5 query matching every term of ``text`` as a substring; None if there are none."""
+    terms = search_terms(text)
+    if not terms:
+        return None
+    return " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def search_snippet(texts: tuple[str, ...], terms: list[str]) -> str:
+    """Context around the first hit, hits marked with \\x02/\\x03.
+
+    Plain string search: FTS5's snippet() re-tokenizes whole documents,
+    which for long transcripts costs more than the query itself.
+    """
+    needles = [t.lower() for t in terms]
+    for text in texts:
+        folded = text.lower()
+        first = min((i for n in needles if (i := folded.find(n)) >= 0), default=-1)
+        if first < 0:
+            continue
+        start, end = max(0, first - SNIPPET_CONTEXT), first + SNIPPET_CONTEXT * 2
+        spans = sorted((i, i + len(n)) for n in needles for i in _find_all(folded, n, start, end))
+        out, pos = [], start
+        for a, b in spans:
+            if a < pos:
+                continue
+            out += [text[pos:a], "\x02", text[a:b], "\x03"]
+            pos = b
+        out.append(text[pos:end])
+        snippet = "".join(out).replace("\n", " ")
+        return ("…" if start else "") + snippet + ("…" if end < len(text) else "")
+    return ""
+
+
+def _find_all(text: str, needle: str, start: int, end: int) -> Iterator[int]:
+    i = text.find(needle, start, end)
+    while i >= 0:
+        yield i
+        i = text.find(needle, i + len(needle), end)
+
+
+class JobSearchIndex:
+    """Incrementally maintained SQLite FTS5 index over prompts, results and steps.
+
+    Jobs are indexed when they arrive (prompt only) and again when they
+    finish; ``catch_up`` indexes whatever the store holds that the index
+    hasn't seen in its current status (existing history, crashes between
+    the two writes).
+
+    Results are ranked by the columns that match (SEARCH_WEIGHTS), newest
+    first among equals. bm25 is not used: its document frequencies take a
+    pass over every match of every term, hundreds of milliseconds for a
+    common term in 50k jobs, while column-filtered matches within the
+    newest SEARCH_RANK_WINDOW cost a few. Documents are numbered in arrival
+    order, which is what bounds that window.
+    """
+
+    def __init__(self, path: Path = SEARCH_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        try:
+            for stmt in _SEARCH_SCHEMA.split(";\n"):
+                self._db.execute(stmt)
+        except sqlite3.Error:
+            self._db.close()
+            raise
+        # The last query's ranked documents, reused while paging through it
+        self._ranked: tuple[str, list[int]] | None = None
+
+    def add(self, jobs: list[Job]):
+        with self._lock:
+            self._ranked = None
+            self._db.execute("BEGIN")
+            try:
+                for job in jobs:
+                    doc = self._db.execute(
+                        "INSERT INTO search_docs (id, status) VALUES (?, ?)"
+                        " ON CONFLICT (id) DO UPDATE SET status = excluded.status RETURNING doc",
+                        (job.id, job.status.value),
+                    ).fetchone()[0]
+                    steps = "\n".join(s["content"] for s in job.steps or [])
+                    self._db.execute("DELETE FROM search_text WHERE rowid = ?", (doc,))
+                    self._db.execute(
+                        "INSERT INTO search_text (rowid, prompt, result, steps) VALUES (?, ?, ?, ?)",
+                        (doc, job.prompt, job.result or job.error or "", steps),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def remove(self, job_ids: list[str]):
+        with self._lock:
+            self._ranked = None
+            self._db.execute("BEGIN")
+            try:
+                for job_id in job_ids:
+                    row = self._db.execute("DELETE FROM search_docs WHERE id = ? RETURNING doc", (job_id,)).fetchone()
+                    if row:
+                        self._db.execute("DELETE FROM search_text WHERE rowid = ?", row)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def catch_up(self, store: JobStore) -> int:
+        """Index jobs that are missing or stale; returns how many."""
+        with self._lock:
+            indexed = dict(self._db.execute("SELECT id, status FROM search_docs"))
+        # Oldest first, so document numbers follow job time
+        stale = [h.id for h in reversed(store.page()) if indexed.get(h.id) != h.status.value]
+        batch: list[Job] = []
+        size = 0
+        for job_id in stale:
+            if not (job := store.get(job_id)):
+                continue
+            batch.append(job)
+            size += len(job.prompt) + len(job.result or "") + sum(len(s["content"]) for s in job.steps or [])
+            if len(batch) >= SEARCH_BATCH or size >= SEARCH_BATCH_BYTES:
+                self.add(batch)
+                batch, size = [], 0
+        if batch:
+            self.add(batch)
+        return len(stale)
+
+    def _rank(self, query: str) -> list[int]:
+        if self._ranked and self._ranked[0] == query:
+            return self._ranked[1]
+        docs = [r[0] for r in self._db.execute(
+            "SELECT rowid FROM search_text WHERE search_text MATCH ? ORDER BY rowid DESC LIMIT ?",
+            (query, SEARCH_RANK_WINDOW),
+        )]
+        score = dict.fromkeys(docs, 0)
+        if docs:
+            for column, weight in SEARCH_WEIGHTS.items():
+                for (doc,) in self._db.execute(
+                    "SELECT rowid FROM search_text WHERE search_text MATCH ? AND rowid >= ?",
+                    (f"{column} : ({query})", docs[-1]),
+                ):
+                    score[doc] += weight
+        # Stable sort: docs are already newest first
+        docs.sort(key=score.__getitem__, reverse=True)
+        self._ranked = (query, docs)
+        return docs
+
+    def search(self, text: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE) -> list[tuple[str, str]]:
+        """(job id, snippet) for one page of matches; snippets mark hits with \\x02/\\x03."""
+        query = search_query(text)
+        if query is None:
+            return []
+        with self._lock:
+            page = self._rank(query)[offset:offset + limit]
+            if not page:
+                return []
+            rows = {doc: (job_id, texts) for doc, job_id, *texts in self._db.execute(
+                "SELECT d.doc, d.id, t.prompt, t.result, t.steps FROM search_docs AS d"
+                f" JOIN search_text AS t ON t.rowid = d.doc WHERE d.doc IN ({','.join('?' * len(page))})",
+                page,
+            )}
+        terms = search_terms(text)
+        return [(rows[doc][0], search_snippet(rows[doc][1], terms)) for doc in page if doc in rows]
+
+    def count(self, text: str) -> int:
+        """Matches for ``text``, counted up to SEARCH_RANK_WINDOW."""
+        query = search_query(text)
+        if query is None:
+            return 0
+        with self._lock:
+            return len(self._rank(query))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ── Startup snapshot ─────────────────────────────────────────────────────────
+
+# Headers of the most recent jobs, shown while the store is still opening
+SNAPSHOT_FILE = DATA_DIR / "snapshot.json"
+SNAPSHOT_SIZE = 50
+
+
+def save_snapshot(store: JobStore, path: Path = SNAPSHOT_FILE):
+    """Best effort: without a snapshot the next start just shows an empty list first."""
+    rows = [
+        {"id": h.id, "time": h.time, "type": h.type, "status": h.status.value, "prompt": h.preview}
+        for h in store.page(limit=SNAPSHOT_SIZE)
+    ]
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        tmp.write_text(json.dumps(rows))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_snapshot(path: Path = SNAPSHOT_FILE) -> list[JobHeader]:
+    """The last saved headers; a missing or unreadable snapshot is just empty."""
+    try:
+        return [JobHeader.from_dict(d) for d in json.loads(path.read_text())]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+# ── Shared queue (distributed mode) ──────────────────────────────────────────
+
+# "standalone" subscribes and runs jobs in one process; a "leader" subscribes
+# and enqueues auto jobs in the shared jobs.db, and headless "worker"
+# processes (--worker), on this or other hosts, claim and run them
+ROLE = os.environ.get("NTFY_CLAUDE_ROLE", "standalone")
+# A claimed job is reclaimable once its worker stops renewing the lease
+QUEUE_LEASE = float(os.environ.get("NTFY_CLAUDE_LEASE", "60"))
+QUEUE_HEARTBEAT = QUEUE_LEASE / 4
+QUEUE_POLL_INTERVAL = 1.0
+# Claims after which a job that keeps losing its worker is given up
+QUEUE_MAX_ATTEMPTS = 3
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    seq      INTEGER PRIMARY KEY,
+    job_id   TEXT NOT NULL UNIQUE,
+    priority INTEGER NOT NULL DEFAULT 0,
+    owner    TEXT,
+    expires  REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS job_queue_order ON job_queue(priority DESC, seq)
+"""
+
+
+class SharedJobQueue:
+    """Durable auto-job queue next to the jobs in the shared SQLite database.
+
+    The leader ``put``s jobs; workers ``claim`` the highest-priority job
+    nobody holds a lease on and keep it with ``renew`` heartbeats. A job
+    whose worker died stops being renewed and becomes claimable again.
+    ``done`` drops a job once its outcome is in the store. Lease expiry
+    compares wall clocks, so hosts need roughly synchronized time.
+    """
+
+    def __init__(self, path: Path = JOBS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Claims from several processes wait on each other's write locks
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        for stmt in _QUEUE_SCHEMA.split(";\n"):
+            self._db.execute(stmt)
+
+    def put(self, jobs: list[Job]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO job_queue (job_id, priority) VALUES (?, ?)",
+                [(job.id, job.priority) for job in jobs],
+            )
+
+    def claim(self, owner: str) -> tuple[str, int] | None:
+        """Lease the next job: (job id, times it has been claimed)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT seq, job_id, attempts FROM job_queue WHERE expires < ?"
+                    " ORDER BY priority DESC, seq LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE job_queue SET owner = ?, expires = ?, attempts = attempts + 1 WHERE seq = ?",
+                        (owner, now + QUEUE_LEASE, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return (row[1], row[2] + 1) if row else None
+
+    def renew(self, owner: str) -> set[str]:
+        """Extend every lease ``owner`` still holds; returns those job ids."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_queue SET expires = ? WHERE owner = ?", (time.time() + QUEUE_LEASE, owner)
+            )
+            rows = self._db.execute("SELECT job_id FROM job_queue WHERE owner = ?", (owner,)).fetchall()
+        return {r[0] for r in rows}
+
+    def done(self, job_id: str, owner: str):
+        with self._lock:
+            self._db.execute("DELETE FROM job_queue WHERE job_id = ? AND owner = ?", (job_id, owner))
+
+    def release(self, owner: str):
+        """Hand back ``owner``'s jobs at shutdown; that claim doesn't count."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_queue SET owner = NULL, expires = 0, attempts = attempts - 1 WHERE owner = ?",
+                (owner,),
+            )
+
+    def depth(self) -> int:
+        """Jobs waiting for a worker."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE expires < ?", (time.time(),)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ── Since-timestamp persistence ──────────────────────────────────────────────
+
+# Write the cursor after this many advances or seconds, whichever comes first
+CURSOR_FLUSH_COUNT = 200
+CURSOR_FLUSH_INTERVAL = 2.0
+
+
+class SinceCheckpoint:
+    """Batched, atomic persistence of the ntfy ``since`` cursor.
+
+    ``advance`` only records the timestamp in memory; it reaches disk every
+    CURSOR_FLUSH_COUNT advances or CURSOR_FLUSH_INTERVAL seconds, and on
+    ``flush``. Callers advance only after a message's job is in the store,
+    and ``flush`` syncs the store (``sync_store``) before writing, so the
+    cursor never moves past messages that are not durably persisted.
+    """
+
+    def __init__(self, sync_store: Callable[[], object], path: Path = STATE_FILE):
+        self._sync_store = sync_store
+        self._path = path
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._pending: int | None = None
+        self._count = 0
+        self._last_flush = time.monotonic()
+
+    def load(self) -> str:
+        if self._pending is not None:
+            return str(self._pending)
+        try:
+            return self._path.read_text().strip() or "all"
+        except FileNotFoundError:
+            return "all"
+
+    def advance(self, ts: int):
+        if self._pending is not None and ts <= self._pending:
+            return
+        self._pending = ts
+        self._count += 1
+        if (
+            self._count >= CURSOR_FLUSH_COUNT
+            or time.monotonic() - self._last_flush >= CURSOR_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._count:
+            return
+        self._sync_store()
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(str(self._pending))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+        self._count = 0
+
+
+# ── Dedup index ──────────────────────────────────────────────────────────────
+
+DEDUP_FILE = DATA_DIR / "dedup.idx"
+# Ids per Bloom generation; two generations are live, so the filter covers
+# the last 1-2x this many messages (far more than ntfy's 12h replay cache)
+DEDUP_GENERATION_SIZE = 100_000
+DEDUP_FALSE_POSITIVE = 0.01
+# Most recent ids kept exactly (answers replays without a store lookup)
+DEDUP_RECENT = 4096
+# Slack for clock skew between the ntfy server and this machine
+DEDUP_CLOCK_SKEW = 300
+
+
+class _BloomGeneration:
+    def __init__(self, nbits: int, bits: bytearray | None = None, count: int = 0,
+                 min_time: int | None = None, max_time: int | None = None):
+        self.nbits = nbits
+        self.bits = bits if bits is not None else bytearray((nbits + 7) // 8)
+        self.count = count
+        self.min_time = min_time
+        self.max_time = max_time
+
+    def add(self, positions: list[int], ts: int):
+        for pos in positions:
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+        self.min_time = ts if self.min_time is None else min(self.min_time, ts)
+        self.max_time = ts if self.max_time is None else max(self.max_time, ts)
+
+    def __contains__(self, positions: list[int]) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in positions)
+
+
+class DedupIndex:
+    """Persistent "already ingested?" check that never loads the job history.
+
+    A rolling two-generation Bloom filter answers most lookups: a negative
+    means the id is new, no store access needed. Positives are confirmed
+    against a small exact set of recent ids, then the store. Ids the filter
+    cannot vouch for (older than the dropped generations, or stored after
+    the last save before a crash) also go to the store, so replay after a
+    restart stays exact.
+
+    Ingest calls ``reserve`` before storing a batch and ``add_many`` after.
+    ``reserve`` keeps the lowest unsaved time in a small marker file until a
+    save covers it, so the range to verify after a crash does not depend on
+    message times arriving in order (they don't across topics and servers).
+    """
+
+    def __init__(self, store: JobStore, path: Path = DEDUP_FILE,
+                 generation_size: int = DEDUP_GENERATION_SIZE):
+        self._store = store
+        self._path = path
+        self._marker_path = path.with_name(path.name + ".unsaved")
+        self._capacity = generation_size
+        self._nbits = max(64, int(-generation_size * math.log(DEDUP_FALSE_POSITIVE) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._nbits / generation_size * math.log(2)))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._recent: OrderedDict[str, None] = OrderedDict()
+        # Below `_floor`, and within `_unsaved`, the filter is not authoritative
+        self._floor = 0
+        self._unsaved: tuple[int, int] | None = None
+        # Lowest time reserved by a batch not added yet, and the time the
+        # marker file holds (None: no marker)
+        self._reserved: int | None = None
+        self._marker: int | None = None
+        if not self._load():
+            self._gens = [_BloomGeneration(self._nbits), _BloomGeneration(self._nbits)]
+            # Jobs already in the store predate the filter
+            newest = store.page(limit=1)
+            self._floor = newest[0].time + 1 if newest else 0
+
+    def _positions(self, job_id: str) -> list[int]:
+        digest = hashlib.blake2b(job_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._nbits for i in range(self._hashes)]
+
+    def seen(self, job_id: str, ts: int) -> bool:
+        with self._lock:
+            if job_id in self._recent:
+                return True
+            positions = self._positions(job_id)
+            maybe = any(positions in gen for gen in self._gens)
+            trusted = ts >= self._floor and not (self._unsaved and self._unsaved[0] < ts <= self._unsaved[1])
+        if not maybe and trusted:
+            return False
+        return self._store.has(job_id)
+
+    def reserve(self, ts: int):
+        """Mark times from ``ts`` on as unsaved; call before storing their jobs."""
+        with self._lock:
+            self._reserved = ts if self._reserved is None else min(self._reserved, ts)
+            if self._marker is not None and self._marker <= ts:
+                return
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._marker_path, "w") as f:
+                f.write(str(ts))
+                f.flush()
+                os.fsync(f.fileno())
+            self._marker = ts
+
+    def add_many(self, entries: list[tuple[str, int]]):
+        """Record stored (job id, time) pairs, ending the batch's reservation."""
+        with self._lock:
+            for job_id, ts in entries:
+                self._recent[job_id] = None
+                if len(self._recent) > DEDUP_RECENT:
+                    self._recent.popitem(last=False)
+                current = self._gens[-1]
+                if current.count >= self._capacity:
+                    dropped = self._gens.pop(0)
+                    if dropped.max_time is not None:
+                        self._floor = max(self._floor, dropped.max_time + 1)
+                    current = _BloomGeneration(self._nbits)
+                    self._gens.append(current)
+                current.add(self._positions(job_id), ts)
+            self._reserved = None
+            self._dirty = True
+
+    def save(self):
+        """Write the index atomically (no-op when nothing changed)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            header = {
+                "version": 1,
+                "nbits": self._nbits,
+                "hashes": self._hashes,
+                "floor": self._floor,
+                "unsaved": self._unsaved,
+                "generations": [[g.count, g.min_time, g.max_time] for g in self._gens],
+                "recent": list(self._recent),
+            }
+            blobs = [bytes(g.bits) for g in self._gens]
+            self._dirty = False
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+        with self._lock:
+            # Unless a batch was reserved or added while writing, the saved
+            # file covers everything the marker stood for
+            if not self._dirty and self._reserved is None and self._marker is not None:
+                self._marker_path.unlink(missing_ok=True)
+                self._marker = None
+
+    def _load(self) -> bool:
+        try:
+            with open(self._path, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != 1 or header["nbits"] != self._nbits or header["hashes"] != self._hashes:
+                    return False
+                size = (self._nbits + 7) // 8
+                self._gens = []
+                for count, min_time, max_time in header["generations"]:
+                    bits = bytearray(f.read(size))
+                    if len(bits) != size:
+                        return False
+                    self._gens.append(_BloomGeneration(self._nbits, bits, count, min_time, max_time))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self._floor = header["floor"]
+        self._recent = OrderedDict.fromkeys(header["recent"])
+        unsaved = header.get("unsaved")
+        try:
+            marker = int(self._marker_path.read_text())
+        except (OSError, ValueError):
+            marker = None
+        if marker is not None:
+            # Jobs stored after this file was written (crash before the next
+            # save) have times from the marker up to now: verify that range
+            # against the store. It is kept in later saves, as replays of it
+            # can still arrive.
+            low, high = marker - 1, int(time.time()) + DEDUP_CLOCK_SKEW
+            if unsaved:
+                low, high = min(low, unsaved[0]), max(high, unsaved[1])
+            unsaved = (low, high)
+            self._marker = marker
+            self._dirty = True
+        self._unsaved = tuple(unsaved) if unsaved else None
+        return True
+
+
+# ── Result cache ─────────────────────────────────────────────────────────────
+
+# Opt-in: seconds a cached auto result stays valid (0 disables the cache)
+CACHE_TTL = int(os.environ.get("NTFY_CLAUDE_CACHE_TTL", "0"))
+# Entries kept; the least recently used beyond this are evicted
+CACHE_SIZE = int(os.environ.get("NTFY_CLAUDE_CACHE_SIZE", "256"))
+CACHE_DB = DATA_DIR / "cache.db"
+# Not fingerprinted; a tree with more files than the limit is not cached
+DIR_HASH_SKIP = frozenset({".git", "node_modules", "__pycache__", ".venv"})
+DIR_HASH_MAX_FILES = 20000
+# A burst of jobs reuses one fingerprint for this many seconds
+DIR_HASH_TTL = 2.0
+
+
+def directory_fingerprint(root: Path) -> str | None:
+    """Hash of the path, size and mtime of every file under ``root``.
+
+    Returns None when the tree is too large to fingerprint cheaply.
+    """
+    digest = hashlib.sha256()
+    files = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in DIR_HASH_SKIP)
+        for name in sorted(filenames):
+            files += 1
+            if files > DIR_HASH_MAX_FILES:
+                return None
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """SQLite cache of successful auto-job results.
+
+    Keyed on the normalized prompt, the model and a fingerprint of the work
+    directory. Entries expire after ``ttl`` seconds, and the least recently
+    used beyond ``size`` are evicted.
+    """
+
+    def __init__(self, path: Path = CACHE_DB, ttl: int = CACHE_TTL, size: int = CACHE_SIZE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.size = size
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL NOT NULL,"
+            " used REAL NOT NULL, result TEXT, cost_usd REAL, duration_ms INTEGER, steps TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results(used)")
+        self._lock = threading.Lock()
+        self._fingerprints: dict[Path, tuple[float, str | None]] = {}
+
+    @staticmethod
+    def key(prompt: str, model: str, fingerprint: str) -> str:
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256("\0".join((normalized, model, fingerprint)).encode()).hexdigest()
+
+    def fingerprint(self, root: Path) -> str | None:
+        """``directory_fingerprint`` memoized for DIR_HASH_TTL seconds."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._fingerprints.get(root)
+        if cached and now - cached[0] < DIR_HASH_TTL:
+            return cached[1]
+        value = directory_fingerprint(root)
+        with self._lock:
+            self._fingerprints[root] = (now, value)
+        return value
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created, result, cost_usd, duration_ms, steps FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        _, result, cost, duration, steps = row
+        return {"result": result, "cost_usd": cost, "duration_ms": duration,
+                "steps": json.loads(steps) if steps else None}
+
+    def put(self, key: str, job: Job):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?)",
+                (key, now, now, job.result, job.cost_usd, job.duration_ms,
+                 json.dumps(job.steps, ensure_ascii=False) if job.steps else None),
+            )
+            self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM results WHERE key NOT IN"
+                " (SELECT key FROM results ORDER BY used DESC LIMIT ?)", (self.size,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ── Metrics ──────────────────────────────────────────────────────────────────
+
+# Prometheus text endpoint on 127.0.0.1, opt-in (0 = off); give each daemon
+# on a host its own port, e.g. 9464 for the leader and 9465 for a worker
+METRICS_PORT = int(os.environ.get("NTFY_CLAUDE_METRICS_PORT", "0"))
+# Latest observations kept per histogram for percentiles on the stats screen
+METRICS_RESERVOIR = 2048
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+COST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram plus a reservoir of recent values.
+
+    Thread-safe: the ingest thread observes store writes too.
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...], unit: str = "s"):
+        self.name = name
+        self.help = help
+        self.unit = unit
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._recent: deque[float] = deque(maxlen=METRICS_RESERVOIR)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def summary(self) -> dict[str, float]:
+        """count/mean/p50/p95/p99/max (percentiles over recent values)."""
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total = self.count, self.sum
+        if not recent:
+            return {"count": count}
+
+        def pct(q: float) -> float:
+            return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+        return {
+            "count": count,
+            "mean": total / count,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": recent[-1],
+        }
+
+    def exposition(self) -> list[str]:
+        with self._lock:
+            counts, count, total = list(self._counts), self.count, self.sum
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Metrics:
+    """Registry of histograms and callback gauges, rendered for Prometheus."""
+
+    PREFIX = "ntfy_claude_"
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...], unit: str = "s") -> Histogram:
+        hist = self.histograms[name] = Histogram(self.PREFIX + name, help, buckets, unit)
+        return hist
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]):
+        self.gauges[name] = (help, read)
+
+    def exposition(self) -> str:
+        lines: list[str] = []
+        for name, (help, read) in self.gauges.items():
+            lines += [f"# HELP {self.PREFIX}{name} {help}", f"# TYPE {self.PREFIX}{name} gauge",
+                      f"{self.PREFIX}{name} {float(read())}"]
+        for hist in self.histograms.values():
+            lines += hist.exposition()
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+QUEUE_DEPTH = METRICS.histogram(
+    "queue_depth", "Auto jobs waiting for a slot, sampled on submit", DEPTH_BUCKETS, unit="")
+PUBLISH_TO_START = METRICS.histogram(
+    "publish_to_start_seconds", "Time from ntfy publish to claude start", SLOW_BUCKETS)
+JOB_WALL = METRICS.histogram("job_wall_seconds", "Auto job wall time", SLOW_BUCKETS)
+JOB_COST = METRICS.histogram("job_cost_usd", "Auto job cost reported by claude", COST_BUCKETS, unit="$")
+PARSE_TIME = METRICS.histogram("parse_seconds", "stream-json parse time per job", FAST_BUCKETS)
+STORE_WRITE = METRICS.histogram("store_write_seconds", "JobStore write latency", FAST_BUCKETS)
+INGEST_BATCH = METRICS.histogram("ingest_batch_seconds", "Ingest batch decode+store time", FAST_BUCKETS)
+UI_REFRESH = METRICS.histogram("ui_refresh_seconds", "Job list refresh time", FAST_BUCKETS)
+SEARCH_QUERY = METRICS.histogram("search_seconds", "Search query time per result page", FAST_BUCKETS)
+FIRST_STEP = METRICS.histogram(
+    "first_step_seconds", "Time from prompt submission to the first step", FAST_BUCKETS + SLOW_BUCKETS[1:])
+
+
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal HTTP/1.0 responder: GET /metrics → Prometheus text format."""
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        method, path, *_ = request.split(b"\r\n", 1)[0].decode().split(" ")
+        if method == "GET" and path.split("?")[0] == "/metrics":
+            status, body = "200 OK", METRICS.exposition().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError, ValueError,
+            ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+# ── Profiling ────────────────────────────────────────────────────────────────
+
+# "cprofile" or "pyinstrument" starts profiling at launch; `p` toggles it
+PROFILE_ENGINE = os.environ.get("NTFY_CLAUDE_PROFILE", "")
+PROFILE_DIR = DATA_DIR / "profiles"
+
+
+class HotPathProfiler:
+    """Opt-in profiler for the event loop and the ingest thread.
+
+    The UI thread (parsing, store updates, list refreshes) is profiled
+    continuously while active; worker threads opt in per call with
+    ``section()``. pyinstrument, when chosen and installed, samples the UI
+    thread only.
+    """
+
+    def __init__(self, engine: str = PROFILE_ENGINE or "cprofile", out_dir: Path = PROFILE_DIR):
+        self.engine = engine
+        self.out_dir = out_dir
+        self.active = False
+        self._owner: int | None = None
+        self._main = None
+        self._threads: dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.active:
+            return
+        if self.engine == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._main = Profiler(async_mode="enabled")
+            self._main.start()
+        else:
+            import cProfile
+
+            self._main = cProfile.Profile()
+            self._main.enable()
+        self._owner = threading.get_ident()
+        self._threads = {}
+        self.active = True
+
+    @contextmanager
+    def section(self):
+        """Profile a hot path running on a worker thread."""
+        if not self.active or self.engine != "cprofile" or threading.get_ident() == self._owner:
+            yield
+            return
+        import cProfile
+
+        with self._lock:
+            prof = self._threads.setdefault(threading.get_ident(), cProfile.Profile())
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+ allows a single active cProfile at a time
+            yield
+            return
+        try:
+            yield
+        finally:
+            prof.disable()
+
+    def stop(self) -> Path | None:
+        """Stop and write the profile; returns its path."""
+        if not self.active:
+            return None
+        self.active = False
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        if self.engine == "pyinstrument":
+            self._main.stop()
+            path = self.out_dir / f"profile-{stamp}.html"
+            path.write_text(self._main.output_html())
+        else:
+            import pstats
+
+            self._main.disable()
+            stats = pstats.Stats(self._main)
+            with self._lock:
+                for prof in self._threads.values():
+                    stats.add(prof)
+            path = self.out_dir / f"profile-{stamp}.prof"
+            stats.dump_stats(path)
+        self._main = None
+        return path
+
+
+# ── Subscriptions ────────────────────────────────────────────────────────────
+
+
+@dataclass(frozen=True)
+class Subscription:
+    """One ntfy topic: where to subscribe, its cursor and its auto-job slots."""
+
+    label: str
+    server: str
+    topic: str
+    concurrency: int
+    cursor: Path
+
+    @property
+    def url(self) -> str:
+        return f"{self.server}/{self.topic}/json"
+
+
+def parse_subscriptions(spec: str) -> list[Subscription]:
+    """Parse NTFY_TOPICS; without it, the single NTFY_SERVER/NTFY_TOPIC pair.
+
+    Entries look like ``team-a=secret-topic:2`` or
+    ``team-b=https://ntfy.example.com/other-topic``. The label names the
+    topic in the UI, job history and cursor file (default: the topic name);
+    ``:N`` is its auto-job concurrency (default MAX_CONCURRENCY).
+    """
+    if not spec.strip():
+        return [Subscription("default", NTFY_SERVER.rstrip("/"), NTFY_TOPIC, MAX_CONCURRENCY, STATE_FILE)]
+    subs: list[Subscription] = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        label, sep, target = entry.partition("=")
+        if not sep:
+            label, target = "", entry
+        concurrency = MAX_CONCURRENCY
+        head, sep, tail = target.rpartition(":")
+        if sep and tail.isdigit():
+            target, concurrency = head, int(tail)
+        if "://" in target:
+            server, _, topic = target.rstrip("/").rpartition("/")
+        else:
+            server, topic = NTFY_SERVER.rstrip("/"), target
+        label = label or topic
+        if not topic or "://" in topic or not all(c.isalnum() or c in "._-" for c in label):
+            raise ValueError(f"NTFY_TOPICS: invalid entry {entry!r}")
+        if any(s.label == label or (s.server, s.topic) == (server, topic) for s in subs):
+            raise ValueError(f"NTFY_TOPICS: duplicate entry {entry!r}")
+        subs.append(Subscription(label, server, topic, concurrency, CURSOR_DIR / label))
+    return subs
+
+
+SUBSCRIPTIONS = parse_subscriptions(NTFY_TOPICS)
+
+
+# ── ntfy HTTP client ─────────────────────────────────────────────────────────
+
+
+def make_ntfy_client(streams: int = 1) -> httpx.AsyncClient:
+    """Long-lived pooled client for one server's subscriptions.
+
+    It is reused across reconnects and carries ``streams`` concurrent topic
+    streams. HTTP/2 is used when the ``h2`` package is available.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(
+            connect=NTFY_CONNECT_TIMEOUT, read=NTFY_READ_TIMEOUT, write=10.0, pool=10.0
+        ),
+        limits=httpx.Limits(
+            max_connections=streams + 3,
+            max_keepalive_connections=streams + 1,
+            keepalive_expiry=NTFY_KEEPALIVE_EXPIRY,
+        ),
+        headers={"User-Agent": "ntfy-claude-daemon"},
+    )
+
+
+# ── Message decoding ─────────────────────────────────────────────────────────
+
+# Ingest pipeline batching: at most this many lines, gathered for this long
+INGEST_BATCH_SIZE = 500
+INGEST_BATCH_WINDOW = 0.05
+
+
+def decode_message(msg: dict) -> Job | None:
+    """Turn an ntfy ``message`` event into a new job (None if it has no prompt)."""
+    body = msg.get("message", "")
+    msg_id = msg.get("id", str(msg.get("time", "")))
+    msg_time = msg.get("time", int(time.time()))
+
+    priority = 0
+    cache_policy = None
+    try:
+        payload = json.loads(body)
+        task_type = payload.get("type", "interactive")
+        prompt = payload.get("prompt", body)
+        # {"cache": false} skips the result cache, {"refresh": true} re-runs and re-caches
+        if payload.get("cache") is False:
+            cache_policy = "bypass"
+        elif payload.get("refresh"):
+            cache_policy = "refresh"
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        task_type = "interactive"
+        prompt = body
+    else:
+        # a malformed optional field must not turn the message into an interactive one
+        try:
+            priority = int(payload.get("priority", 0))
+        except (TypeError, ValueError, OverflowError):
+            priority = 0
+
+    if not prompt:
+        return None
+
+    return Job(
+        id=msg_id,
+        time=msg_time,
+        prompt=prompt,
+        type=task_type,
+        # auto jobs wait for the scheduler; interactive ones are "sent to Zellij"
+        status=JobStatus.PENDING if task_type == "auto" else JobStatus.COMPLETED,
+        priority=priority,
+        cache_policy=cache_policy,
+    )
+
+
+# ── stream-json parser ───────────────────────────────────────────────────────
+
+
+def _json_backend() -> tuple[str, Callable[[bytes], object], tuple[type[Exception], ...]]:
+    """Pick the fastest available JSON decoder; NTFY_CLAUDE_JSON forces one."""
+    wanted = os.environ.get("NTFY_CLAUDE_JSON", "")
+    if wanted in ("", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.loads, (orjson.JSONDecodeError,)
+        except ImportError:
+            pass
+    if wanted in ("", "msgspec"):
+        try:
+            import msgspec
+            return "msgspec", msgspec.json.Decoder().decode, (msgspec.DecodeError,)
+        except ImportError:
+            pass
+    return "json", json.loads, (ValueError,)
+
+
+JSON_BACKEND, json_loads, JSON_DECODE_ERRORS = _json_backend()
+
+# Only assistant and result events carry steps; everything else (notably the
+# large "user" tool-result events) is dropped by looking at the line head,
+# where claude writes the "type" key, before it is decoded
+_ROUTED_MARKERS = (b'"assistant"', b'"result"')
+ROUTE_PREFIX_BYTES = 64
+
+# Tool summaries are cut to this many characters, and each argument to
+# ARG_SUMMARY_LEN, so nothing beyond that is ever serialized
+TOOL_SUMMARY_LEN = 200
+ARG_SUMMARY_LEN = 50
+
+
+def _json_prefix(value: object, limit: int) -> str:
+    """``json.dumps(value)`` for at least its first ``limit`` characters.
+
+    Rendering stops once ``limit`` characters exist, so huge tool inputs are
+    never serialized in full.
+    """
+    out: list[str] = []
+    size = 0
+
+    def emit(text: str) -> bool:
+        nonlocal size
+        out.append(text)
+        size += len(text)
+        return size < limit
+
+    def walk(v: object) -> bool:
+        if isinstance(v, dict):
+            if not emit("{"):
+                return False
+            for i, (k, x) in enumerate(v.items()):
+                if (i and not emit(", ")) or not emit(json.dumps(str(k), ensure_ascii=False) + ": "):
+                    return False
+                if not walk(x):
+                    return False
+            return emit("}")
+        if isinstance(v, list):
+            if not emit("["):
+                return False
+            for i, x in enumerate(v):
+                if (i and not emit(", ")) or not walk(x):
+                    return False
+            return emit("]")
+        if isinstance(v, str):
+            # Cutting before encoding keeps the first `limit` characters exact
+            return emit(json.dumps(v[:limit], ensure_ascii=False))
+        return emit(json.dumps(v, ensure_ascii=False))
+
+    walk(value)
+    return "".join(out)
+
+
+def _format_tool_args(input_data: dict, budget: int = TOOL_SUMMARY_LEN) -> str:
+    """Format tool input as compact key=value pairs.
+
+    Stops adding pairs once ``budget`` characters are reached, since the
+    caller truncates the summary there anyway.
+    """
+    parts = []
+    size = 0
+    for k, v in input_data.items():
+        if isinstance(v, str):
+            v_disp = v if len(v) <= ARG_SUMMARY_LEN else v[:ARG_SUMMARY_LEN - 3] + "..."
+            part = f'{k}="{v_disp}"'
+        else:
+            v_str = _json_prefix(v, ARG_SUMMARY_LEN + 1)
+            if len(v_str) > ARG_SUMMARY_LEN:
+                v_str = v_str[:ARG_SUMMARY_LEN - 3] + "..."
+            part = f"{k}={v_str}"
+        parts.append(part)
+        size += len(part) + 2
+        if size > budget:
+            break
+    return ", ".join(parts)
+
+
+class StreamJsonParser:
+    """Incremental parser for claude --output-format stream-json.
+
+    Feed it one raw line at a time; ``feed`` returns the steps that line added.
+    Each step: {"type": "text"|"tool_use", "content": "..."}.
+    """
+
+    def __init__(self):
+        self.steps: list[dict] = []
+        self.result_event: dict | None = None
+        # Lines that were not stream-json events (plain output fallback)
+        self.other_lines: list[str] = []
+        self._routes = {"assistant": self._on_assistant, "result": self._on_result}
+
+    def feed(self, line: bytes) -> list[dict]:
+        line = line.strip()
+        if not line:
+            return []
+        if line[:1] == b"{":
+            head = line[:ROUTE_PREFIX_BYTES]
+            if not any(marker in head for marker in _ROUTED_MARKERS):
+                return []
+        try:
+            event = json_loads(line)
+        except JSON_DECODE_ERRORS:
+            self.other_lines.append(line.decode(errors="replace"))
+            return []
+        if not isinstance(event, dict):
+            return []
+        route = self._routes.get(event.get("type"))
+        if route is None:
+            return []
+        new = route(event)
+        self.steps.extend(new)
+        return new
+
+    def _on_assistant(self, event: dict) -> list[dict]:
+        new: list[dict] = []
+        for block in event.get("message", {}).get("content", []):
+            btype = block.get("type")
+            if btype == "text":
+                text = block.get("text", "")
+                if text.strip():
+                    new.append({"type": "text", "content": text})
+            elif btype == "tool_use":
+                name = block.get("name", "?")
+                args = _format_tool_args(block.get("input", {}))
+                summary = f"{name}({args})"
+                if len(summary) > TOOL_SUMMARY_LEN:
+                    summary = summary[:TOOL_SUMMARY_LEN - 3] + "..."
+                new.append({"type": "tool_use", "content": summary})
+        return new
+
+    def _on_result(self, event: dict) -> list[dict]:
+        self.result_event = event
+        return []
+
+
+def parse_stream_json(stdout: str | bytes) -> tuple[list[dict], dict | None]:
+    """Parse a complete stream-json output.
+
+    Returns (steps, result_event_or_none).
+    """
+    if isinstance(stdout, str):
+        stdout = stdout.encode()
+    parser = StreamJsonParser()
+    for line in stdout.splitlines():
+        parser.feed(line)
+    return parser.steps, parser.result_event
+
+
+# ── claude processes ─────────────────────────────────────────────────────────
+
+# Warm pool: idle claude sessions kept ready for auto jobs (0 disables it)
+CLAUDE_POOL_SIZE = int(os.environ.get("NTFY_CLAUDE_POOL_SIZE", "0"))
+# Jobs a warm session serves before it is recycled; above 1, later jobs see
+# the conversation of earlier ones
+CLAUDE_POOL_MAX_JOBS = int(os.environ.get("NTFY_CLAUDE_POOL_MAX_JOBS", "1"))
+# Idle sessions older than this are recycled (picks up config/MCP changes)
+CLAUDE_POOL_MAX_IDLE = 900.0
+# claude prints nothing before its first prompt, so a booting session is only
+# leased once it has stayed up this long (or printed its init event earlier)
+CLAUDE_POOL_WARMUP = float(os.environ.get("NTFY_CLAUDE_POOL_WARMUP", "5"))
+CLAUDE_POOL_CHECK_INTERVAL = 15.0
+# stderr kept per process for error messages
+STDERR_TAIL_BYTES = 64 * 1024
+
+# Per-process rlimits for claude (0 = unlimited): CPU seconds and address space
+CLAUDE_CPU_SECONDS = int(os.environ.get("NTFY_CLAUDE_CPU_SECONDS", "0"))
+CLAUDE_ADDRESS_SPACE = os.environ.get("NTFY_CLAUDE_ADDRESS_SPACE", "0")
+# Optional cgroup v2 placement: a delegated, writable cgroup directory in which
+# each claude process gets its own child group with these quotas
+CLAUDE_CGROUP = os.environ.get("NTFY_CLAUDE_CGROUP", "")
+CLAUDE_MEMORY_MAX = os.environ.get("NTFY_CLAUDE_MEMORY_MAX", "0")
+CLAUDE_CPU_MAX = float(os.environ.get("NTFY_CLAUDE_CPU_MAX", "0"))  # CPUs
+# Seconds between SIGTERM and SIGKILL when stopping a claude process group
+CLAUDE_KILL_GRACE = float(os.environ.get("NTFY_CLAUDE_KILL_GRACE", "5"))
+RUN_DIR = DATA_DIR / "run"
+
+
+# Runs in front of claude: applies rlimits, joins the job's cgroup before
+# exec so nothing escapes it, then waits for claude and reports its rusage.
+# Signals are ignored here so the group-wide SIGTERM reaches claude while
+# the launcher survives to write the accounting and exit status.
+_LAUNCHER = """
+import json, os, resource, signal, sys
+usage_path, cpu, addr, cgroup, *cmd = sys.argv[1:]
+cpu, addr = int(cpu), int(addr)
+if cpu:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+if addr:
+    resource.setrlimit(resource.RLIMIT_AS, (addr, addr))
+if cgroup:
+    with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+        f.write(str(os.getpid()))
+for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+    signal.signal(sig, signal.SIG_IGN)
+pid = os.fork()
+if pid == 0:
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    try:
+        os.execvp(cmd[0], cmd)
+    except OSError:
+        sys.stderr.write(cmd[0] + " command not found\\n")
+        os._exit(127)
+_, status, ru = os.wait4(pid, 0)
+with open(usage_path, "w") as f:
+    json.dump({"maxrss": ru.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+               "cpu": ru.ru_utime + ru.ru_stime}, f)
+# claude is gone: end whatever it left in the group (and holding its pipes)
+os.killpg(0, signal.SIGTERM)
+code = os.waitstatus_to_exitcode(status)
+os._exit(code if code >= 0 else 128 - code)
+"""
+_launches = itertools.count()
+
+
+def claude_command(prompt: str | None) -> list[str]:
+    """claude CLI arguments; without a prompt it reads stream-json from stdin."""
+    cmd = ["claude", "-p"]
+    if prompt is not None:
+        cmd.append(prompt)
+    else:
+        cmd += ["--input-format", "stream-json"]
+    return cmd + [
+        "--model", CLAUDE_MODEL,
+        "--output-format", "stream-json",
+        "--verbose",
+        "--max-turns", "100",
+        "--dangerously-skip-permissions",
+    ]
+
+
+class ClaudeProcess:
+    """A claude CLI in its own process group, behind the rlimit launcher.
+
+    stderr is drained into a bounded tail; ``usage`` reports peak RSS and
+    CPU seconds once the process has exited.
+    """
+
+    def __init__(self, proc: asyncio.subprocess.Process, usage_path: Path, cgroup: Path | None):
+        self.proc = proc
+        self._exited = asyncio.Event()
+        self._waiter = asyncio.create_task(self._wait())
+        self.jobs = 0
+        self.idle_since = time.monotonic()
+        self._usage_path = usage_path
+        self._cgroup = cgroup
+        self._stderr = bytearray()
+        self._drain = asyncio.create_task(self._read_stderr())
+        # stdout lines read while waiting for the session to become ready
+        self.preamble: list[bytes] = []
+
+    @classmethod
+    async def spawn(cls, prompt: str | None = None) -> ClaudeProcess:
+        RUN_DIR.mkdir(parents=True, exist_ok=True)
+        name = f"{os.getpid()}-{next(_launches)}"
+        usage_path = RUN_DIR / f"{name}.usage"
+        cgroup = make_cgroup(name) if CLAUDE_CGROUP else None
+        try:
+            # Run in sandboxed work directory with full auto permissions
+            # (settings.json in NTFY_CLAUDE_DIR enables sandbox isolation)
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", _LAUNCHER,
+                str(usage_path), str(CLAUDE_CPU_SECONDS), str(parse_size(CLAUDE_ADDRESS_SPACE)),
+                str(cgroup or ""), *claude_command(prompt),
+                stdin=asyncio.subprocess.DEVNULL if prompt is not None else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=NTFY_CLAUDE_DIR,
+                limit=STREAM_LINE_LIMIT,
+                start_new_session=True,
+            )
+        except BaseException:
+            if cgroup:
+                _remove_cgroup(cgroup)
+            raise
+        return cls(proc, usage_path, cgroup)
+
+    async def _wait(self):
+        await self.proc.wait()
+        self._exited.set()
+
+    async def _read_stderr(self):
+        while chunk := await self.proc.stderr.read(65536):
+            self._stderr += chunk
+            del self._stderr[:-STDERR_TAIL_BYTES]
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    async def wait_ready(self, warmup: float) -> bool:
+        """Wait until a stream-json session can take a prompt.
+
+        It is ready once it has stayed up for ``warmup`` seconds, or as soon
+        as it prints a line (kept in ``preamble`` for the job's parser).
+        False if it exited while booting.
+        """
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), warmup)
+        except TimeoutError:
+            return self.alive
+        except ValueError:
+            return False
+        if not line:
+            return False
+        self.preamble.append(line)
+        return True
+
+    async def send(self, prompt: str, last: bool):
+        """Submit a prompt to a stream-json session; ``last`` ends its input."""
+        message = {"type": "user", "message": {"role": "user", "content": [{"type": "text", "text": prompt}]}}
+        self.proc.stdin.write(json.dumps(message).encode() + b"\n")
+        await self.proc.stdin.drain()
+        if last:
+            self.proc.stdin.close()
+
+    async def wait_exit(self) -> int:
+        """Wait for the launcher to exit and its pipes to close.
+
+        The launcher signals claude's process group on its way out, so
+        leftover children don't hold stdout/stderr open.
+        """
+        await self._exited.wait()
+        return self.proc.returncode
+
+    async def stderr_text(self) -> str:
+        if not self.alive:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._drain), 1.0)
+            except TimeoutError:
+                pass
+        return self._stderr.decode(errors="replace")
+
+    def signal_group(self, sig: int):
+        try:
+            os.killpg(self.proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def stop(self):
+        """SIGTERM the process group, SIGKILL it after CLAUDE_KILL_GRACE.
+
+        Anything left in the group after claude exits (MCP servers, tool
+        subprocesses) is killed too.
+        """
+        # The group outlives the launcher while any leftover child is in it;
+        # proc.wait() returns once all of them have released the pipes
+        self.signal_group(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.proc.wait()), CLAUDE_KILL_GRACE)
+        except TimeoutError:
+            self.signal_group(signal.SIGKILL)
+            await asyncio.shield(self.proc.wait())
+
+    async def discard(self):
+        """Stop a process nobody accounts for and clean up after it."""
+        await self.stop()
+        self.usage()
+
+    def usage(self) -> tuple[float | None, float | None]:
+        """(peak RSS in MB, CPU seconds) of the exited process; cleans up."""
+        rss = cpu = None
+        try:
+            data = json.loads(self._usage_path.read_text())
+            rss, cpu = data["maxrss"], data["cpu"]
+            self._usage_path.unlink()
+        except (OSError, ValueError, KeyError):
+            pass
+        if self._cgroup:
+            # The cgroup also counts descendants that were never waited for
+            try:
+                rss = int((self._cgroup / "memory.peak").read_text())
+            except (OSError, ValueError):
+                pass
+            try:
+                stat = dict(line.split() for line in (self._cgroup / "cpu.stat").read_text().splitlines())
+                cpu = int(stat["usage_usec"]) / 1e6
+            except (OSError, ValueError, KeyError):
+                pass
+            _remove_cgroup(self._cgroup)
+        return (round(rss / (1 << 20), 1) if rss is not None else None,
+                round(cpu, 2) if cpu is not None else None)
+
+
+def make_cgroup(name: str) -> Path:
+    """Create a child cgroup for one claude process and apply the quotas."""
+    path = Path(CLAUDE_CGROUP) / f"ntfy-claude-{name}"
+    path.mkdir()
+    try:
+        if memory := parse_size(CLAUDE_MEMORY_MAX):
+            (path / "memory.max").write_text(str(memory))
+        if CLAUDE_CPU_MAX:
+            period = 100_000
+            (path / "cpu.max").write_text(f"{int(CLAUDE_CPU_MAX * period)} {period}")
+    except OSError:
+        _remove_cgroup(path)
+        raise
+    return path
+
+
+def _remove_cgroup(path: Path):
+    try:
+        path.rmdir()
+    except OSError:
+        pass
+
+
+class ClaudePool:
+    """Warm claude sessions (stream-json input mode) leased to auto jobs.
+
+    Keeps ``size`` idle sessions booted; a session only becomes idle (and
+    leasable) once ``wait_ready`` says it finished booting, so a job never
+    waits on a half-started session. A leased session gets the prompt on
+    stdin and is recycled after ``max_jobs`` jobs, after a failed job, and
+    when it dies or idles past CLAUDE_POOL_MAX_IDLE. Event-loop only.
+    """
+
+    def __init__(self, size: int, max_jobs: int, log: Callable[[str], object]):
+        self.size = size
+        self.max_jobs = max(1, max_jobs)
+        self._log = log
+        self._idle: deque[ClaudeProcess] = deque()
+        self._spawning = 0
+        self._booting: set[ClaudeProcess] = set()
+        # Leased sessions that will come back, so refill doesn't replace them
+        self._returning = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def lease(self) -> ClaudeProcess | None:
+        """A ready idle session, or None (the caller cold-starts claude).
+
+        Counts the job against the session; ``release`` must follow.
+        """
+        worker = None
+        while self._idle and worker is None:
+            candidate = self._idle.popleft()
+            if candidate.alive:
+                worker = candidate
+            else:
+                self._retire(candidate)
+        if worker:
+            worker.jobs += 1
+            if worker.jobs < self.max_jobs:
+                self._returning += 1
+        self.refill()
+        return worker
+
+    def release(self, worker: ClaudeProcess, reusable: bool):
+        if worker.jobs < self.max_jobs:
+            self._returning -= 1
+        if (
+            reusable and worker.alive and worker.jobs < self.max_jobs
+            and not self._closed and len(self._idle) < self.size
+        ):
+            worker.idle_since = time.monotonic()
+            self._idle.append(worker)
+        else:
+            self._retire(worker)
+        self.refill()
+
+    def refill(self):
+        while not self._closed and len(self._idle) + self._spawning + self._returning < self.size:
+            self._spawning += 1
+            self._track(self._spawn())
+
+    def check(self):
+        """Health check: retire dead or stale idle sessions and top up."""
+        now = time.monotonic()
+        for worker in list(self._idle):
+            if not worker.alive or now - worker.idle_since > CLAUDE_POOL_MAX_IDLE:
+                self._idle.remove(worker)
+                self._retire(worker)
+        self.refill()
+
+    def close(self):
+        self._closed = True
+        for worker in [*self._idle, *self._booting]:
+            worker.signal_group(signal.SIGKILL)
+        self._idle.clear()
+
+    async def _spawn(self):
+        try:
+            worker = await ClaudeProcess.spawn()
+        except OSError as e:
+            self._spawning -= 1
+            self._log(f"Warm claude session failed to start: {e}")
+            return
+        self._booting.add(worker)
+        try:
+            ready = await worker.wait_ready(CLAUDE_POOL_WARMUP)
+        finally:
+            self._booting.discard(worker)
+            self._spawning -= 1
+        if not ready:
+            self._log(f"Warm claude session exited while starting: {(await worker.stderr_text()).strip()[-200:]}")
+        if self._closed or not ready:
+            await worker.discard()
+        else:
+            worker.idle_since = time.monotonic()
+            self._idle.append(worker)
+
+    def _retire(self, worker: ClaudeProcess):
+        self._track(worker.discard())
+
+    def _track(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+# ── Scheduler ────────────────────────────────────────────────────────────────
+
+
+class JobScheduler:
+    """Bounded-concurrency priority queue for auto jobs.
+
+    Higher ``Job.priority`` runs first; within a priority jobs run in the
+    order they were submitted. ``start`` is called once a slot is free, and
+    the caller must call ``release`` when that job finishes. Not thread-safe:
+    use it from the UI thread only.
+    """
+
+    def __init__(self, max_concurrency: int, start: Callable[[Job], object]):
+        self._max = max(1, max_concurrency)
+        self._start = start
+        self._queue: list[tuple[int, int, Job]] = []
+        self._seq = itertools.count()
+        self.running = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def submit(self, job: Job):
+        heapq.heappush(self._queue, (-job.priority, next(self._seq), job))
+        self._drain()
+        QUEUE_DEPTH.observe(len(self._queue))
+
+    def release(self):
+        self.running = max(0, self.running - 1)
+        self._drain()
+
+    def _drain(self):
+        while self._queue and self.running < self._max:
+            _, _, job = heapq.heappop(self._queue)
+            self.running += 1
+            self._start(job)
+
+
+# ── Widgets ──────────────────────────────────────────────────────────────────
+
+STATUS_ICONS = {
+    JobStatus.PENDING: "⏳",
+    JobStatus.RUNNING: ">>",
+    JobStatus.COMPLETED: "OK",
+    JobStatus.FAILED: "ERR",
+}
+
+
+class ConnectionStatus(Static):
+    def update_status(self, connected: int, topics: int, job_count: int | None, running_count: int, queued_count: int):
+        if connected == topics:
+            conn = "Connected"
+        elif connected:
+            conn = f"Connected {connected}/{topics}"
+        else:
+            conn = "Disconnected"
+        if job_count is None:
+            self.update(f" {conn} | Loading job history...")
+            return
+        self.update(
+            f" {conn} | Jobs: {job_count} | Running: {running_count} | Queued: {queued_count} "
+        )
+
+
+def job_markup(header: JobHeader) -> str:
+    """Rich markup for one job list row."""
+    icon = STATUS_ICONS.get(header.status, "??")
+    ts = datetime.fromtimestamp(header.time).strftime("%m/%d %H:%M")
+    prompt_text = escape(header.preview[:60])
+
+    # interactive jobs are displayed muted
+    if header.type == "interactive":
+        return f" [dim]INT  {prompt_text}  {ts}[/]"
+    elif header.status == JobStatus.FAILED:
+        return f" [bold red]{icon}[/]  {prompt_text}  [dim]{ts}[/]"
+    elif header.status == JobStatus.RUNNING:
+        return f" [bold yellow]{icon}[/]  {prompt_text}  [dim]{ts}[/]"
+    elif header.status == JobStatus.COMPLETED:
+        return f" [bold green]{icon}[/]  {prompt_text}  [dim]{ts}[/]"
+    else:
+        return f" [dim]{icon}[/]  {prompt_text}  [dim]{ts}[/]"
+
+
+class JobListItem(ListItem):
+    """A single row in the job list."""
+
+    def __init__(self, header: JobHeader, **kwargs):
+        super().__init__(**kwargs)
+        self.header = header
+
+    def compose(self) -> ComposeResult:
+        yield Label(job_markup(self.header))
+
+    def set_header(self, header: JobHeader):
+        """Re-render this row in place for an updated job."""
+        self.header = header
+        self.query_one(Label).update(job_markup(header))
+
+
+# Rows fetched from the store per query, and how many such blocks stay cached
+VIRTUAL_FETCH_BLOCK = 100
+VIRTUAL_CACHED_BLOCKS = 8
+
+
+class VirtualJobList(ScrollView, can_focus=True):
+    """Job list that renders only the visible rows.
+
+    Rows are drawn with the Line API and fetched from the store in blocks by
+    range, so there is one widget and a bounded row cache however large the
+    history grows.
+    """
+
+    BINDINGS = [
+        Binding("up", "cursor_up", show=False),
+        Binding("down", "cursor_down", show=False),
+        Binding("pageup", "page_up", show=False),
+        Binding("pagedown", "page_down", show=False),
+        Binding("home", "first", show=False),
+        Binding("end", "last", show=False),
+        Binding("enter", "select", show=False),
+    ]
+
+    COMPONENT_CLASSES = {"virtual-job-list--cursor"}
+
+    DEFAULT_CSS = """
+    VirtualJobList > .virtual-job-list--cursor {
+        background: $accent 40%;
+    }
+    """
+
+    class Selected(Message):
+        def __init__(self, header: JobHeader):
+            super().__init__()
+            self.header = header
+
+    def __init__(self, store: JobStore, **kwargs):
+        super().__init__(**kwargs)
+        self._store = store
+        self._blocks: OrderedDict[int, list[JobHeader]] = OrderedDict()
+        self._total = 0
+        self.cursor = 0
+
+    def on_mount(self):
+        self.reload()
+
+    def reload(self):
+        """Drop cached rows and re-read the row count."""
+        self._blocks.clear()
+        self._total = self._store.count()
+        self.virtual_size = Size(self.size.width, self._total)
+        self.cursor = min(self.cursor, max(self._total - 1, 0))
+        self.refresh()
+
+    def insert_rows(self, count: int):
+        """Account for ``count`` new jobs at the top, keeping the view on the same jobs."""
+        self.reload()
+        if self.cursor or self.scroll_y:
+            self.cursor += count
+            self.scroll_to(y=self.scroll_y + count, animate=False)
+
+    def update_rows(self, headers: list[JobHeader]):
+        """Swap changed headers into the cache and repaint."""
+        changed = {h.id: h for h in headers}
+        for rows in self._blocks.values():
+            for i, h in enumerate(rows):
+                if h.id in changed:
+                    rows[i] = changed[h.id]
+        self.refresh()
+
+    def header_at(self, index: int) -> JobHeader | None:
+        if not 0 <= index < self._total:
+            return None
+        block, pos = divmod(index, VIRTUAL_FETCH_BLOCK)
+        rows = self._blocks.get(block)
+        if rows is None:
+            rows = self._store.page(offset=block * VIRTUAL_FETCH_BLOCK, limit=VIRTUAL_FETCH_BLOCK)
+            self._blocks[block] = rows
+            if len(self._blocks) > VIRTUAL_CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        return rows[pos] if pos < len(rows) else None
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.scrollable_content_region.width
+        header = self.header_at(index)
+        if header is None:
+            return Strip.blank(width, self.rich_style)
+        text = Text.from_markup(job_markup(header), end="")
+        if index == self.cursor and self.has_focus:
+            text.pad_right(width - text.cell_len)
+            text.stylize(self.get_component_rich_style("virtual-job-list--cursor"))
+        strip = Strip(list(text.render(self.app.console)), text.cell_len)
+        return strip.crop_extend(scroll_x, scroll_x + width, self.rich_style)
+
+    def move_cursor(self, index: int, top: bool = False):
+        if not self._total:
+            return
+        self.cursor = max(0, min(index, self._total - 1))
+        height = self.scrollable_content_region.height
+        if top or self.cursor < self.scroll_y:
+            self.scroll_to(y=self.cursor, animate=False)
+        elif self.cursor >= self.scroll_y + height:
+            self.scroll_to(y=self.cursor - height + 1, animate=False)
+        self.refresh()
+
+    def on_focus(self):
+        self.refresh()
+
+    def on_blur(self):
+        self.refresh()
+
+    def on_click(self, event: events.Click):
+        self.move_cursor(self.scroll_y + event.y)
+
+    def action_cursor_up(self):
+        self.move_cursor(self.cursor - 1)
+
+    def action_cursor_down(self):
+        self.move_cursor(self.cursor + 1)
+
+    def action_page_up(self):
+        self.move_cursor(self.cursor - self.scrollable_content_region.height)
+
+    def action_page_down(self):
+        self.move_cursor(self.cursor + self.scrollable_content_region.height)
+
+    def action_first(self):
+        self.move_cursor(0)
+
+    def action_last(self):
+        self.move_cursor(self._total - 1)
+
+    def action_select(self):
+        if header := self.header_at(self.cursor):
+            self.post_message(self.Selected(header))
+
+
+class JumpToDateScreen(ModalScreen[int | None]):
+    """Ask for a date and return it as a timestamp (end of that minute/day)."""
+
+    BINDINGS = [Binding("escape", "dismiss_none", "Cancel")]
+
+    CSS = """
+    JumpToDateScreen {
+        align: center middle;
+    }
+    #jump-input {
+        width: 40;
+    }
+    """
+
+    def compose(self) -> ComposeResult:
+        yield Input(placeholder="YYYY-MM-DD [HH:MM]", id="jump-input")
+
+    def on_input_submitted(self, event: Input.Submitted):
+        value = event.value.strip()
+        for fmt, span in (("%Y-%m-%d %H:%M", 60), ("%Y-%m-%d", 86400)):
+            try:
+                start = datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+            self.dismiss(int(start.timestamp()) + span - 1)
+            return
+        self.notify(f"Invalid date: {value}", severity="error")
+
+    def action_dismiss_none(self):
+        self.dismiss(None)
+
+
+class StatsScreen(Screen):
+    """Live view of the metrics registry (gauges and histograms)."""
+
+    BINDINGS = [
+        Binding("escape", "pop_screen", "Back"),
+        Binding("q", "pop_screen", "Back"),
+    ]
+
+    CSS = """
+    #stats-content {
+        height: 1fr;
+        padding: 1;
+    }
+    """
 
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=False)
+        with VerticalScroll(id="stats-content"):
+            yield Static(id="stats-gauges")
+            yield Static(id="stats-histograms")
+        yield Footer()
 
-# ── Data Model ───────────────────────────────────────────────────────────────
+    def on_mount(self):
+        self._render_stats()
+        self.set_interval(1.0, self._render_stats)
 
+    @staticmethod
+    def _fmt(value: float, unit: str) -> str:
+        if unit == "s":
+            return f"{value * 1000:.1f}ms" if value < 1 else f"{value:.2f}s"
+        if unit == "$":
+            return f"${value:.3f}"
+        return f"{value:g}"
 
-class JobStatus(Enum):
-    PENDING = "pending"
-    RUNNING = "running"
-    COMPLETED = "completed"
-    FAILED = "failed"
+    def _render_stats(self):
+        gauges = Table(box=None, title="Now", title_justify="left")
+        gauges.add_column("Gauge")
+        gauges.add_column("Value", justify="right")
+        for name, (_, read) in METRICS.gauges.items():
+            gauges.add_row(name, f"{read():g}")
 
+        hists = Table(box=None, title="Histograms", title_justify="left")
+        hists.add_column("Metric")
+        for col in ("Count", "Mean", "p50", "p95", "p99", "Max"):
+            hists.add_column(col, justify="right")
+        for name, hist in METRICS.histograms.items():
+            s = hist.summary()
+            if s["count"] and "mean" in s:
+                cells = [self._fmt(s[k], hist.unit) for k in ("mean", "p50", "p95", "p99", "max")]
+            else:
+                cells = ["-"] * 5
+            hists.add_row(name, str(s["count"]), *cells)
 
-@dataclass
-class Job:
-    id: str
-    time: int
-    prompt: str
-    type: str  # "auto" | "interactive"
-    status: JobStatus = JobStatus.PENDING
-    result: str | None = None
-    cost_usd: float | None = None
-    duration_ms: int | None = None
-    error: str | None = None
-    steps: list[dict] | None = None  # [{"type": "text"|"tool_use", "content": "..."}]
+        self.query_one("#stats-gauges", Static).update(gauges)
+        self.query_one("#stats-histograms", Static).update(hists)
 
-    def to_dict(self) -> dict:
-        d = asdict(self)
-        d["status"] = self.status.value
-        return d
+    def action_pop_screen(self):
+        self.app.pop_screen()
 
-    @classmethod
-    def from_dict(cls, d: dict) -> Job:
-        d = dict(d)
-        d["status"] = JobStatus(d["status"])
-        # Drop unknown keys for forward compat
-        from dataclasses import fields as _fields
-        known = {f.name for f in _fields(cls)}
-        return cls(**{k: v for k, v in d.items() if k in known})
 
+def snippet_markup(snippet: str) -> str:
+    """Rich markup for a search snippet, hits in bold."""
+    return "    [dim]" + escape(snippet).replace("\x02", "[/][bold]").replace("\x03", "[/][dim]") + "[/]"
 
-# ── Job Store (JSONL) ────────────────────────────────────────────────────────
 
+class SearchResultItem(JobListItem):
+    """A job list row with the matching text under it."""
 
-class JobStore:
-    def __init__(self, path: Path = JOBS_FILE):
-        self._path = path
-        self._jobs: dict[str, Job] = {}
-        self._load()
+    def __init__(self, header: JobHeader, snippet: str, **kwargs):
+        super().__init__(header, **kwargs)
+        self.snippet = snippet
 
-    def _load(self):
-        if not self._path.exists():
-            return
-        for line in self._path.read_text().splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                job = Job.from_dict(json.loads(line))
-                self._jobs[job.id] = job
-            except (json.JSONDecodeError, TypeError, KeyError):
-                continue
+    def compose(self) -> ComposeResult:
+        yield Label(job_markup(self.header))
+        yield Label(snippet_markup(self.snippet))
 
-    def _save(self):
-        self._path.parent.mkdir(parents=True, exist_ok=True)
-        lines = [json.dumps(j.to_dict(), ensure_ascii=False) for j in self._jobs.values()]
-        self._path.write_text("\n".join(lines) + "\n" if lines else "")
 
-    def add(self, job: Job):
-        self._jobs[job.id] = job
-        self._save()
+class SearchScreen(Screen):
+    """Full-text search over prompts, results and steps.
 
-    def update(self, job: Job):
-        self._jobs[job.id] = job
-        self._save()
+    Queries run as you type (after SEARCH_DEBOUNCE) in a thread; further
+    pages load when the highlight reaches the last result.
+    """
 
-    def get(self, job_id: str) -> Job | None:
-        return self._jobs.get(job_id)
+    BINDINGS = [
+        Binding("escape", "pop_screen", "Back"),
+    ]
 
-    def all_auto(self) -> list[Job]:
-        """Return auto jobs sorted by time descending."""
-        return sorted(
-            (j for j in self._jobs.values() if j.type == "auto"),
-            key=lambda j: j.time,
-            reverse=True,
-        )
+    CSS = """
+    #search-summary {
+        padding: 0 1;
+        color: $text-muted;
+    }
+    #search-results {
+        height: 1fr;
+    }
+    """
 
-    def all_jobs(self) -> list[Job]:
-        """Return all jobs sorted by time descending."""
-        return sorted(
-            self._jobs.values(),
-            key=lambda j: j.time,
-            reverse=True,
-        )
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._text = ""
+        self._total = 0
+        self._loaded = 0
+        self._fetching = False
 
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=False)
+        yield Input(placeholder="Search prompts, results and steps (terms of 3+ characters)", id="search-input")
+        yield Label("", id="search-summary")
+        yield ListView(id="search-results")
+        yield Footer()
 
-# ── Since-timestamp persistence ──────────────────────────────────────────────
+    def on_input_changed(self, event: Input.Changed):
+        self._text = event.value
+        self.run_search(event.value, 0)
 
+    def on_input_submitted(self, event: Input.Submitted):
+        results = self.query_one("#search-results", ListView)
+        if len(results):
+            results.index = 0
+            results.focus()
 
-def load_since() -> str:
-    try:
-        return STATE_FILE.read_text().strip()
-    except FileNotFoundError:
-        return "all"
+    @work(exclusive=True, group="search")
+    async def run_search(self, text: str, offset: int):
+        summary = self.query_one("#search-summary", Label)
+        results = self.query_one("#search-results", ListView)
+        if offset == 0:
+            await asyncio.sleep(SEARCH_DEBOUNCE)
+            if search_query(text) is None:
+                await results.clear()
+                self._total = self._loaded = 0
+                summary.update("Type a term of at least 3 characters" if text.strip() else "")
+                return
+        self._fetching = True
+        try:
+            hits, total, elapsed = await asyncio.to_thread(self._fetch, text, offset)
+            items = [SearchResultItem(header, snippet) for header, snippet in hits]
+            if offset == 0:
+                await results.clear()
+            await results.extend(items)
+            self._total, self._loaded = total, offset + SEARCH_PAGE_SIZE
+            more = "+" if total >= SEARCH_RANK_WINDOW else ""
+            summary.update(f"{total}{more} matches ({elapsed * 1000:.0f} ms)")
+        finally:
+            self._fetching = False
 
+    def _fetch(self, text: str, offset: int) -> tuple[list[tuple[JobHeader, str]], int, float]:
+        """One page of (header, snippet), the match count and the query time.
 
-def save_since(ts: int):
-    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    STATE_FILE.write_text(str(ts))
+        Runs in a thread: the index and store locks are also held by ingest
+        batches, which must not stall the event loop.
+        """
+        index = self.app.search
+        started = time.perf_counter()
+        hits = index.search(text, offset)
+        total = index.count(text) if offset == 0 else self._total
+        elapsed = time.perf_counter() - started
+        SEARCH_QUERY.observe(elapsed)
+        found = {h.id: h for h in self.app.store.headers([job_id for job_id, _ in hits])}
+        return [(found[job_id], snippet) for job_id, snippet in hits if job_id in found], total, elapsed
 
+    def on_list_view_highlighted(self, event: ListView.Highlighted):
+        last = len(event.list_view) - 1
+        if event.list_view.index == last and self._loaded < self._total and not self._fetching:
+            self.run_search(self._text, self._loaded)
 
-# ── stream-json parser ───────────────────────────────────────────────────────
+    def on_list_view_selected(self, event: ListView.Selected):
+        # Results are JobListItems too; don't let the app open them again
+        event.stop()
+        if isinstance(event.item, SearchResultItem):
+            self.app._open_detail(event.item.header)
 
+    def action_pop_screen(self):
+        self.app.pop_screen()
 
-def _format_tool_args(input_data: dict) -> str:
-    """Format tool input as compact key=value pairs."""
-    parts = []
-    for k, v in input_data.items():
-        if isinstance(v, str):
-            v_disp = v if len(v) <= 50 else v[:47] + "..."
-            parts.append(f'{k}="{v_disp}"')
-        else:
-            v_str = json.dumps(v, ensure_ascii=False)
-            if len(v_str) > 50:
-                v_str = v_str[:47] + "..."
-            parts.append(f"{k}={v_str}")
-    return ", ".join(parts)
 
+# ── Detail Screen ────────────────────────────────────────────────────────────
 
-def parse_stream_json(stdout: str) -> tuple[list[dict], dict | None]:
-    """Parse claude --output-format stream-json output.
+# Transcript blocks mounted when the detail screen opens, and per scroll step
+DETAIL_CHUNK = 20
+# Longest tool-use line shown in a transcript
+TOOL_LINE_LEN = 120
+# Parsed Markdown kept across detail screens, keyed by job id and step index
+MARKDOWN_CACHE_SIZE = 1000
 
-    Returns (steps, result_event_or_none).
-    Each step: {"type": "text"|"tool_use", "content": "..."}.
-    """
-    steps: list[dict] = []
-    result_event: dict | None = None
+_markdown_tokens: OrderedDict[tuple, list] = OrderedDict()
+_markdown_lock = threading.Lock()
 
-    for line in stdout.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            event = json.loads(line)
-        except json.JSONDecodeError:
-            continue
 
-        etype = event.get("type")
+class CachedMarkdownParser:
+    """``Markdown(parser_factory=...)`` parser that parses each step only once.
 
-        if etype == "assistant":
-            for block in event.get("message", {}).get("content", []):
-                btype = block.get("type")
-                if btype == "text":
-                    text = block.get("text", "")
-                    if text.strip():
-                        steps.append({"type": "text", "content": text})
-                elif btype == "tool_use":
-                    name = block.get("name", "?")
-                    args = _format_tool_args(block.get("input", {}))
-                    summary = f"{name}({args})"
-                    if len(summary) > 200:
-                        summary = summary[:197] + "..."
-                    steps.append({"type": "tool_use", "content": summary})
+    Token lists live in a module-wide LRU, so reopening a job rebuilds its
+    widgets without re-parsing. Textual calls ``parse`` from an executor
+    thread, hence the lock.
+    """
 
-        elif etype == "result":
-            result_event = event
+    def __init__(self, job_id: str, index: int):
+        self._key = (job_id, index)
 
-    return steps, result_event
+    def parse(self, text: str) -> list:
+        # Steps never change once written; the length guards the result
+        # fallback, which a re-run can replace
+        key = (*self._key, len(text))
+        with _markdown_lock:
+            if (tokens := _markdown_tokens.get(key)) is not None:
+                _markdown_tokens.move_to_end(key)
+                return tokens
+        from markdown_it import MarkdownIt
 
+        tokens = MarkdownIt("gfm-like").parse(text)
+        with _markdown_lock:
+            _markdown_tokens[key] = tokens
+            while len(_markdown_tokens) > MARKDOWN_CACHE_SIZE:
+                _markdown_tokens.popitem(last=False)
+        return tokens
 
-# ── Widgets ──────────────────────────────────────────────────────────────────
 
-STATUS_ICONS = {
-    JobStatus.PENDING: "⏳",
-    JobStatus.RUNNING: ">>",
-    JobStatus.COMPLETED: "OK",
-    JobStatus.FAILED: "ERR",
-}
+def _clip(text: str, limit: int = TOOL_LINE_LEN) -> str:
+    return text if len(text) <= limit else text[:limit - 3] + "..."
 
 
-class ConnectionStatus(Static):
-    def update_status(self, connected: bool, job_count: int, running_count: int):
-        conn = "Connected" if connected else "Disconnected"
-        self.update(f" {conn} | Jobs: {job_count} | Running: {running_count} ")
+class ToolRun(Static, can_focus=True):
+    """Consecutive tool uses as one widget, collapsed to a line until toggled."""
 
+    BINDINGS = [Binding("enter", "toggle", "Expand", show=False)]
 
-class JobListItem(ListItem):
-    """A single row in the job list."""
+    def __init__(self, summaries: list[str]):
+        self.summaries = summaries
+        self.expanded = False
+        super().__init__(self._markup(), classes="step-tool-use")
 
-    def __init__(self, job: Job, **kwargs):
-        super().__init__(**kwargs)
-        self.job = job
+    def _markup(self) -> str:
+        if len(self.summaries) == 1:
+            return f"[dim]🔧 {escape(_clip(self.summaries[0]))}[/]"
+        names = ", ".join(dict.fromkeys(s.split("(", 1)[0] for s in self.summaries))
+        title = f"🔧 {len(self.summaries)} tool calls: {escape(_clip(names))}"
+        if not self.expanded:
+            return f"[dim]▶ {title}[/]"
+        lines = "\n".join(f"    {escape(_clip(s))}" for s in self.summaries)
+        return f"[dim]▼ {title}\n{lines}[/]"
 
-    def compose(self) -> ComposeResult:
-        icon = STATUS_ICONS.get(self.job.status, "??")
-        ts = datetime.fromtimestamp(self.job.time).strftime("%m/%d %H:%M")
-        prompt_text = self.job.prompt[:60]
-
-        # interactive jobs are displayed muted
-        if self.job.type == "interactive":
-            yield Label(f" [dim]INT  {prompt_text}  {ts}[/]")
-        elif self.job.status == JobStatus.FAILED:
-            yield Label(f" [bold red]{icon}[/]  {prompt_text}  [dim]{ts}[/]")
-        elif self.job.status == JobStatus.RUNNING:
-            yield Label(f" [bold yellow]{icon}[/]  {prompt_text}  [dim]{ts}[/]")
-        elif self.job.status == JobStatus.COMPLETED:
-            yield Label(f" [bold green]{icon}[/]  {prompt_text}  [dim]{ts}[/]")
-        else:
-            yield Label(f" [dim]{icon}[/]  {prompt_text}  [dim]{ts}[/]")
+    def set_summaries(self, summaries: list[str]):
+        self.summaries = summaries
+        self.update(self._markup())
 
+    def action_toggle(self):
+        self.expanded = not self.expanded
+        self.update(self._markup())
 
-# ── Detail Screen ────────────────────────────────────────────────────────────
+    def on_click(self):
+        self.action_toggle()
 
 
 class JobDetailScreen(Screen):
@@ -307,43 +3140,132 @@ class JobDetailScreen(Screen):
     def __init__(self, job: Job, **kwargs):
         super().__init__(**kwargs)
         self.job = job
+        self._steps = list(job.steps or [])
+        # Step indexes grouped into blocks (a text step, or a run of tool
+        # uses); blocks past `_mounted` are mounted as the user scrolls
+        self._blocks: list[list[int]] = []
+        self._group(0)
+        self._mounted = 0
+        # The last mounted widget while it is a tool run that may still grow
+        self._tail: ToolRun | None = None
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=False)
         yield Label(f" Prompt: {self.job.prompt}", id="detail-prompt")
         with VerticalScroll(id="detail-content"):
-            if self.job.steps:
-                for step in self.job.steps:
-                    if step["type"] == "text":
-                        yield Markdown(step["content"])
-                    elif step["type"] == "tool_use":
-                        content = step["content"]
-                        if len(content) > 120:
-                            content = content[:117] + "..."
-                        yield Static(
-                            f"[dim]🔧 {content}[/]",
-                            classes="step-tool-use",
-                        )
+            if self._steps:
+                yield from self._next_widgets(DETAIL_CHUNK)
             elif self.job.result:
-                yield Markdown(self.job.result)
+                yield self._markdown(self.job.result, -1)
             elif self.job.error:
-                yield Static(f"[bold red]Error:[/] {self.job.error}")
-            elif self.job.status == JobStatus.RUNNING:
-                yield Static("[dim]Running...[/]")
+                yield Static(f"[bold red]Error:[/] {escape(self.job.error)}", id="detail-error")
+            elif self.job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+                yield Static("[dim]Running...[/]", id="detail-placeholder")
             else:
                 yield Static("[dim]No output[/]")
-        yield self._meta_bar()
+        yield Static(self._meta_text(), id="detail-meta")
         yield Footer()
 
-    def _meta_bar(self) -> Static:
+    def on_mount(self):
+        content = self.query_one("#detail-content", VerticalScroll)
+        self.watch(content, "scroll_y", self._load_more, init=False)
+        content.call_after_refresh(self._load_more)
+
+    def _group(self, start: int):
+        for i in range(start, len(self._steps)):
+            last = self._blocks[-1] if self._blocks else None
+            if last and self._steps[i]["type"] == "tool_use" and self._steps[last[-1]]["type"] == "tool_use":
+                last.append(i)
+            else:
+                self._blocks.append([i])
+
+    def _markdown(self, text: str, index: int) -> Markdown:
+        from textual.widgets import Markdown
+
+        return Markdown(text, parser_factory=lambda: CachedMarkdownParser(self.job.id, index))
+
+    def _block_widget(self, block: list[int]) -> Markdown | ToolRun:
+        step = self._steps[block[0]]
+        if step["type"] == "text":
+            return self._markdown(step["content"], block[0])
+        return ToolRun([self._steps[i]["content"] for i in block])
+
+    def _next_widgets(self, count: int) -> list[Markdown | ToolRun]:
+        widgets = [self._block_widget(b) for b in self._blocks[self._mounted:self._mounted + count]]
+        if widgets:
+            self._mounted += len(widgets)
+            self._tail = widgets[-1] if isinstance(widgets[-1], ToolRun) else None
+        return widgets
+
+    def _load_more(self):
+        """Mount the next chunk once the user nears the end of what is mounted."""
+        if self._mounted >= len(self._blocks):
+            return
+        content = self.query_one("#detail-content", VerticalScroll)
+        if content.max_scroll_y - content.scroll_y <= content.size.height:
+            content.mount_all(self._next_widgets(DETAIL_CHUNK))
+            # Keep going until the viewport is filled
+            content.call_after_refresh(self._load_more)
+
+    def sync_steps(self, steps: list[dict]):
+        """Add the steps streamed in since the screen was opened."""
+        if len(steps) <= len(self._steps):
+            return
+        start, self._steps = len(self._steps), list(steps)
+        blocks = len(self._blocks)
+        self._group(start)
+        for placeholder in self.query("#detail-placeholder"):
+            placeholder.remove()
+        if self._mounted < blocks:
+            # Not scrolled to the end yet: mounted with the rest later
+            return
+        content = self.query_one("#detail-content", VerticalScroll)
+        follow = content.scroll_y >= content.max_scroll_y
+        if self._tail:
+            # Tool uses continuing the last mounted run join it
+            self._tail.set_summaries([self._steps[i]["content"] for i in self._blocks[blocks - 1]])
+        content.mount_all(self._next_widgets(len(self._blocks) - self._mounted))
+        if follow:
+            content.call_after_refresh(content.scroll_end, animate=False)
+
+    def refresh_job(self, job: Job):
+        """Update the meta bar, and the output once the job has finished."""
+        self.job = job
+        self.query_one("#detail-meta", Static).update(self._meta_text())
+        if job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+            return
+        content = self.query_one("#detail-content", VerticalScroll)
+        if placeholders := self.query("#detail-placeholder"):
+            # No steps streamed in: show the result as `compose` would have
+            placeholders.remove()
+            if job.result:
+                content.mount(self._markdown(job.result, -1))
+            elif not job.error:
+                content.mount(Static("[dim]No output[/]"))
+        if job.error and job.status == JobStatus.FAILED:
+            text = f"[bold red]Error:[/] {escape(job.error)}"
+            if errors := self.query("#detail-error"):
+                errors.first(Static).update(text)
+            else:
+                content.mount(Static(text, id="detail-error"))
+
+    def _meta_text(self) -> str:
         parts: list[str] = []
         parts.append(self.job.status.value.capitalize())
+        if self.job.topic and len(SUBSCRIPTIONS) > 1:
+            parts.append(f"Topic: {self.job.topic}")
+        if self.job.cached:
+            parts.append("Cached")
         if self.job.duration_ms is not None:
             secs = self.job.duration_ms / 1000
             parts.append(f"Duration: {secs:.1f}s")
         if self.job.cost_usd is not None:
             parts.append(f"Cost: ${self.job.cost_usd:.3f}")
-        return Static(" | ".join(parts), id="detail-meta")
+        if self.job.peak_rss_mb is not None:
+            parts.append(f"Peak RSS: {self.job.peak_rss_mb:.0f}MB")
+        if self.job.cpu_seconds is not None:
+            parts.append(f"CPU: {self.job.cpu_seconds:.1f}s")
+        return " | ".join(parts)
 
     def action_pop_screen(self):
         self.app.pop_screen()
@@ -358,12 +3280,20 @@ class NtfyClaudeApp(App):
     BINDINGS = [
         Binding("q", "quit", "Quit"),
         Binding("r", "refresh_list", "Refresh"),
+        Binding("m", "load_more", "More"),
+        Binding("g", "jump_to_date", "Jump to date"),
+        Binding("/", "search", "Search"),
+        Binding("s", "show_stats", "Stats"),
+        Binding("p", "toggle_profiler", "Profile"),
     ]
 
     CSS = """
-    #job-list {
+    #job-list, #job-snapshot {
         height: 1fr;
     }
+    #job-snapshot {
+        padding: 0 1;
+    }
     #status-bar {
         height: 3;
         padding: 1;
@@ -372,142 +3302,659 @@ class NtfyClaudeApp(App):
     }
     """
 
-    def __init__(self):
+    def __init__(self, role: str = ROLE):
         super().__init__()
-        self.store = JobStore()
-        self._connected = False
+        self.role = role
+        # Opened by `load_store` while the first frame renders and the
+        # subscribers connect; None until then
+        self.store: JobStore | None = None
+        self.dedup: DedupIndex | None = None
+        self.search: JobSearchIndex | None = None
+        # Why search is off once the store is loaded (an old SQLite)
+        self._search_error: str | None = None
+        self._store_ready = threading.Event()
+        self._first_frame = threading.Event()
+        # Seconds from the end of the imports to the first frame and store ready
+        self.startup: dict[str, float] = {}
+        self.queue = None
+        if role != "standalone":
+            if STORE_ENGINE != "sqlite":
+                raise RuntimeError(f"{role} mode needs the sqlite store (NTFY_CLAUDE_STORE=sqlite)")
+            self.queue = SharedJobQueue()
+        # Auto jobs this leader shows as pending/running, refreshed from the
+        # shared store as workers update them
+        self._watched: set[str] = set()
+        self._data_version = 0
+        # Jobs this worker holds leases on, and the runs of those started
+        self._claimed: set[str] = set()
+        self._runs: dict[str, tuple[Job, Worker]] = {}
+        # Each topic has its own cursor and its own auto-job slots
+        self.subscriptions = SUBSCRIPTIONS
+        self.schedulers = {s.label: JobScheduler(s.concurrency, self.run_claude_auto) for s in SUBSCRIPTIONS}
+        self.checkpoints = {s.label: SinceCheckpoint(self._sync_store, s.cursor) for s in SUBSCRIPTIONS}
+        self.profiler = HotPathProfiler()
+        self.cache = ResultCache() if CACHE_TTL > 0 else None
+        self.archive = JobArchive()
+        self.retention = RetentionPolicy()
+        self.pool = ClaudePool(CLAUDE_POOL_SIZE, CLAUDE_POOL_MAX_JOBS, self.log.warning) if CLAUDE_POOL_SIZE else None
+        # (subscription label, raw ntfy line) from the subscribers to the ingest thread
+        self._ingest_queue: queue.Queue[tuple[str, str]] = queue.Queue()
+        # Labels of the subscriptions whose stream is up
+        self._connected: set[str] = set()
+        self._list_limit = JOB_PAGE_SIZE
+        # Decided once the store is open
+        self._virtual = False
+        # Rows keyed by job id, and updates waiting for the next frame
+        self._rows: dict[str, JobListItem] = {}
+        self._pending_rows: dict[str, JobHeader] = {}
+        self._pending_new: set[str] = set()
+        self._flush_scheduled = False
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
-        yield ListView(id="job-list")
+        # One static widget stands in for the list until the store is open;
+        # a row widget per snapshot job would delay the first frame
+        snapshot = load_snapshot() if self.role != "worker" else []
+        yield Static("\n".join(job_markup(h) for h in snapshot), id="job-snapshot")
         yield ConnectionStatus(id="status-bar")
         yield Footer()
 
     def on_mount(self):
+        if PROFILE_ENGINE:
+            self.profiler.start()
+        self._register_gauges()
+        self.call_after_refresh(self._on_first_frame)
+        self._update_status_bar()
+        # The store opens in a thread while the first frame renders and the
+        # subscribers connect; lines received meanwhile wait in the ingest queue
+        self.load_store()
+        self.set_interval(CURSOR_FLUSH_INTERVAL, self._flush_state)
+        if self.role == "worker":
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self.exit)
+        else:
+            self.start_ingest()
+        if METRICS_PORT:
+            self.start_metrics_server()
+        if self.pool:
+            self.pool.refill()
+            self.set_interval(CLAUDE_POOL_CHECK_INTERVAL, self.pool.check)
+
+    def _on_first_frame(self):
+        self.startup["first_frame"] = time.perf_counter() - _STARTED
+        self._first_frame.set()
+        # Started here rather than in on_mount: importing httpx and opening
+        # the streams would otherwise compete with the first frame
+        if self.role != "worker":
+            self.start_ntfy_subscriber()
+
+    @work(thread=True, exclusive=True, group="store")
+    def load_store(self):
+        """Open the store and the dedup index off the UI thread."""
+        store = open_job_store()
+        dedup = DedupIndex(store)
+        try:
+            search = JobSearchIndex()
+        except sqlite3.OperationalError as e:
+            # Everything but search works without FTS5 trigrams
+            self._search_error = f"Search unavailable (needs SQLite 3.34+, have {sqlite3.sqlite_version}): {e}"
+            self.log.warning(self._search_error)
+            search = None
+        virtual = LIST_MODE == "virtual" or (LIST_MODE == "auto" and store.count() > VIRTUAL_LIST_THRESHOLD)
+        if self.role != "worker":
+            save_snapshot(store)
+        self.startup["store_ready"] = time.perf_counter() - _STARTED
+        # Building the list would hold up the first frame if that's still pending
+        worker = get_current_worker()
+        while not self._first_frame.wait(0.1):
+            if worker.is_cancelled:
+                store.close()
+                if search:
+                    search.close()
+                return
+        self.call_from_thread(self._on_store_ready, store, dedup, search, virtual)
+
+    async def _on_store_ready(self, store: JobStore, dedup: DedupIndex, search: JobSearchIndex | None,
+                              virtual: bool):
+        self.store, self.dedup, self.search = store, dedup, search
+        self._virtual = virtual
+        job_list = VirtualJobList(store, id="job-list") if virtual else ListView(id="job-list")
+        await self.query_one("#job-snapshot").remove()
+        await self.mount(job_list, before=self.query_one("#status-bar"))
+        job_list.focus()
+        # Interrupted jobs are reset to PENDING before the list is built
+        self._requeue_pending()
         self._refresh_job_list()
         self._update_status_bar()
-        self.start_ntfy_subscriber()
+        self._store_ready.set()
+        if self.role != "worker" and self.search:
+            self.catch_up_search()
+        if self.role == "worker":
+            self.set_interval(QUEUE_POLL_INTERVAL, self._claim_jobs)
+            self.set_interval(QUEUE_HEARTBEAT, self._renew_leases)
+        if self.role == "leader":
+            self.set_interval(QUEUE_POLL_INTERVAL, self._sync_shared_state)
+        if self.retention.enabled and self.role != "worker":
+            self.run_retention()
+            self.set_interval(RETENTION_INTERVAL, self.run_retention)
+
+    def _sync_store(self):
+        # Cursors only advance for ingested jobs, which needs the store open
+        self.store.sync()
+
+    def _flush_state(self):
+        for checkpoint in self.checkpoints.values():
+            checkpoint.flush()
+        if self.dedup is not None:
+            self.dedup.save()
+
+    def _scheduler_for(self, job: Job) -> JobScheduler:
+        # Jobs from before multi-topic support, or from a topic that was
+        # since removed from NTFY_TOPICS, use the first topic's slots
+        return self.schedulers.get(job.topic) or next(iter(self.schedulers.values()))
+
+    @property
+    def queued(self) -> int:
+        return sum(s.queued for s in self.schedulers.values())
+
+    @property
+    def running(self) -> int:
+        return sum(s.running for s in self.schedulers.values())
+
+    def _register_gauges(self):
+        METRICS.gauge("queued_jobs", "Auto jobs waiting for a slot", lambda: self.queued)
+        METRICS.gauge("running_jobs", "Auto jobs running", lambda: self.running)
+        METRICS.gauge("ingest_backlog", "ntfy lines waiting for the ingest thread", self._ingest_queue.qsize)
+        METRICS.gauge("warm_sessions", "Idle warm claude sessions", lambda: self.pool.idle if self.pool else 0)
+        METRICS.gauge("connected", "Topics whose ntfy stream is up", lambda: len(self._connected))
+        for phase, what in (("first_frame", "first frame drawn"), ("store_ready", "job store loaded")):
+            METRICS.gauge(f"startup_{phase}_seconds", f"Seconds from module load to {what}",
+                          lambda phase=phase: self.startup.get(phase, 0))
+
+    def _requeue_pending(self):
+        """Put auto jobs still PENDING from a previous run back in the queue.
+
+        Standalone, jobs left RUNNING were interrupted when the app exited and
+        are rerun from the start, like a leader's lost leases.
+        """
+        if self.role == "worker":
+            return
+        pending = self.store.page(type="auto", status=JobStatus.PENDING)
+        if self.role == "leader":
+            # Jobs stored just before a crash may not have reached the queue
+            self.queue.put([job for h in pending if (job := self.store.get(h.id))])
+            running = self.store.page(type="auto", status=JobStatus.RUNNING)
+            self._watched.update(h.id for h in pending + running)
+            return
+        running = self.store.page(type="auto", status=JobStatus.RUNNING)
+        for header in sorted(pending + running, key=lambda h: h.time):
+            if job := self.store.get(header.id):
+                if job.status == JobStatus.RUNNING:
+                    job.status = JobStatus.PENDING
+                    job.steps = job.result = job.error = None
+                    self.store.update(job)
+                self._scheduler_for(job).submit(job)
+
+    def on_unmount(self):
+        if self.role == "worker":
+            # Interrupted jobs go straight back to the other workers
+            self.queue.release(WORKER_ID)
+        if self.queue:
+            self.queue.close()
+        if self.pool:
+            self.pool.close()
+        self.profiler.stop()
+        self._flush_state()
+        if self.cache:
+            self.cache.close()
+        if self.store is not None:
+            if self.role != "worker":
+                save_snapshot(self.store)
+            self.store.close()
+        if self.search is not None:
+            self.search.close()
 
     # ── List management ──────────────────────────────────────────────────
 
     def _refresh_job_list(self):
+        """Rebuild the whole list from the store (startup, `r`, `m`)."""
+        if self.store is None:
+            return
+        with UI_REFRESH.time():
+            if self._virtual:
+                self.query_one("#job-list", VirtualJobList).reload()
+                return
+            list_view: ListView = self.query_one("#job-list", ListView)
+            list_view.clear()
+            self._rows = {h.id: JobListItem(h) for h in self.store.page(limit=self._list_limit)}
+            list_view.extend(self._rows.values())
+
+    def _queue_row_update(self, header: JobHeader, new: bool = False):
+        """Schedule a keyed row update; bursts within one frame are coalesced."""
+        self._pending_rows[header.id] = header
+        if new:
+            self._pending_new.add(header.id)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.call_after_refresh(self._flush_row_updates)
+
+    async def _flush_row_updates(self):
+        with UI_REFRESH.time():
+            await self._apply_row_updates()
+
+    async def _apply_row_updates(self):
+        self._flush_scheduled = False
+        pending, self._pending_rows = self._pending_rows, {}
+        new, self._pending_new = self._pending_new, set()
+        if self._virtual:
+            self._flush_virtual_rows(list(pending.values()), len(new))
+            return
         list_view: ListView = self.query_one("#job-list", ListView)
-        list_view.clear()
-        for job in self.store.all_jobs():
-            list_view.append(JobListItem(job))
+
+        new_items: list[JobListItem] = []
+        for header in sorted(pending.values(), key=lambda h: h.time, reverse=True):
+            if row := self._rows.get(header.id):
+                row.set_header(header)
+            elif header.id in new:
+                row = self._rows[header.id] = JobListItem(header)
+                new_items.append(row)
+            # Else the job is past the loaded page: `m` loads it with its state
+
+        if new_items:
+            # Keep the highlight on the same job while rows are inserted above it
+            highlighted = list_view.index
+            if len(list_view):
+                await list_view.insert(0, new_items)
+            else:
+                await list_view.extend(new_items)
+            if highlighted is not None:
+                list_view.index = highlighted + len(new_items)
+        self._update_status_bar()
+
+    def _flush_virtual_rows(self, headers: list[JobHeader], new: int):
+        virtual = self.query_one("#job-list", VirtualJobList)
+        if new:
+            virtual.insert_rows(new)
+        virtual.update_rows(headers)
+        self._update_status_bar()
 
     def _update_status_bar(self):
         bar: ConnectionStatus = self.query_one("#status-bar", ConnectionStatus)
-        jobs = self.store.all_auto()
-        running = sum(1 for j in jobs if j.status == JobStatus.RUNNING)
-        bar.update_status(self._connected, len(jobs), running)
+        if self.store is None:
+            bar.update_status(len(self._connected), len(self.subscriptions), None, 0, 0)
+            return
+        total = self.store.count(type="auto")
+        running = self.store.count(type="auto", status=JobStatus.RUNNING)
+        queued = self.queue.depth() if self.queue else self.queued
+        bar.update_status(len(self._connected), len(self.subscriptions), total, running, queued)
 
     def action_refresh_list(self):
         self._refresh_job_list()
         self._update_status_bar()
 
+    def action_load_more(self):
+        if self._virtual:
+            return
+        self._list_limit += JOB_PAGE_SIZE
+        self._refresh_job_list()
+
+    def action_show_stats(self):
+        if not isinstance(self.screen, StatsScreen):
+            self.push_screen(StatsScreen())
+
+    def action_toggle_profiler(self):
+        if self.profiler.active:
+            self.notify(f"Profile written to {self.profiler.stop()}")
+            return
+        try:
+            self.profiler.start()
+        except ImportError as e:
+            self.notify(f"Profiler unavailable: {e}", severity="error")
+            return
+        self.notify("Profiling hot paths (p to stop)")
+
+    def action_search(self):
+        if self._search_error:
+            self.notify(self._search_error, severity="warning")
+        elif self.search is None:
+            self.notify("Still loading job history")
+        elif not isinstance(self.screen, SearchScreen):
+            self.push_screen(SearchScreen())
+
+    def action_jump_to_date(self):
+        self.push_screen(JumpToDateScreen(), self._jump_to_time)
+
+    def _jump_to_time(self, ts: int | None):
+        if ts is None:
+            return
+        if self.store is None:
+            self.notify("Still loading job history")
+            return
+        index = self.store.rank(ts)
+        if self._virtual:
+            virtual = self.query_one("#job-list", VirtualJobList)
+            virtual.move_cursor(index, top=True)
+            virtual.focus()
+            return
+        if index >= self._list_limit:
+            self._list_limit = index + JOB_PAGE_SIZE
+            self._refresh_job_list()
+        list_view = self.query_one("#job-list", ListView)
+        self.call_after_refresh(setattr, list_view, "index", index)
+        list_view.focus()
+
+    def _open_detail(self, header: JobHeader):
+        if header.type != "auto":
+            return
+        if self.store is None:
+            self.notify("Still loading job history")
+            return
+        # Steps and result are only loaded when the detail screen opens
+        if job := self.store.get(header.id):
+            self.push_screen(JobDetailScreen(job))
+
     def on_list_view_selected(self, event: ListView.Selected):
-        item = event.item
-        if isinstance(item, JobListItem) and item.job.type == "auto":
-            self.push_screen(JobDetailScreen(item.job))
+        if isinstance(event.item, JobListItem):
+            self._open_detail(event.item.header)
+
+    def on_virtual_job_list_selected(self, event: VirtualJobList.Selected):
+        self._open_detail(event.header)
 
     # ── ntfy subscriber Worker ───────────────────────────────────────────
 
-    @work(thread=True, exclusive=True)
-    def start_ntfy_subscriber(self):
+    @work(exclusive=True)
+    async def start_ntfy_subscriber(self):
+        """Subscribe to every topic; topics on one server share a client."""
+        by_server: dict[str, list[Subscription]] = {}
+        for sub in self.subscriptions:
+            by_server.setdefault(sub.server, []).append(sub)
+        async with AsyncExitStack() as stack, asyncio.TaskGroup() as tasks:
+            for subs in by_server.values():
+                client = await stack.enter_async_context(make_ntfy_client(len(subs)))
+                for sub in subs:
+                    tasks.create_task(self._subscribe_forever(client, sub))
+
+    async def _subscribe_forever(self, client: httpx.AsyncClient, sub: Subscription):
+        import httpx
+
         attempt = 0
-        while not self.app._exit:
+        name = f"[{sub.label}] " if len(self.subscriptions) > 1 else ""
+        while True:
+            started = time.monotonic()
             try:
-                self._subscribe_loop()
-                attempt = 0
+                await self._subscribe_loop(client, sub)
+                reason = "stream closed"
+            except httpx.ReadTimeout:
+                reason = f"no data or keepalive for {NTFY_READ_TIMEOUT:.0f}s"
             except (httpx.HTTPError, httpx.StreamError, ConnectionError) as e:
-                if self.app._exit:
-                    break
-                self.call_from_thread(self._set_disconnected)
-                delay = min(2**attempt, 60)
-                self.log.warning(f"Connection lost: {e}. Retry in {delay}s...")
-                time.sleep(delay)
-                attempt += 1
-
-    def _subscribe_loop(self):
-        since = load_since()
-        url = f"{NTFY_SERVER}/{NTFY_TOPIC}/json"
-
-        with httpx.stream("GET", url, params={"since": since}, timeout=None) as resp:
+                reason = str(e) or type(e).__name__
+            was_connected = sub.label in self._connected
+            self._set_disconnected(sub)
+
+            # A network blip on a healthy stream reconnects right away over
+            # the pooled client; repeated failures back off exponentially
+            if was_connected and time.monotonic() - started >= NTFY_STABLE_SECS:
+                attempt = 0
+                self.log.warning(f"{name}Connection lost: {reason}. Reconnecting...")
+                continue
+            delay = min(2**attempt, 60)
+            self.log.warning(f"{name}Connection lost: {reason}. Retry in {delay}s...")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _subscribe_loop(self, client: httpx.AsyncClient, sub: Subscription):
+        since = self.checkpoints[sub.label].load()
+
+        async with client.stream("GET", sub.url, params={"since": since}) as resp:
             resp.raise_for_status()
-            self.call_from_thread(self._set_connected)
+            self._set_connected(sub)
 
-            for line in resp.iter_lines():
-                if self.app._exit:
-                    return
+            async for line in resp.aiter_lines():
                 if not line.strip():
                     continue
 
-                msg = json.loads(line)
+                self._ingest_queue.put((sub.label, line))
 
-                if ts := msg.get("time"):
-                    save_since(ts)
+    def _set_connected(self, sub: Subscription):
+        self._connected.add(sub.label)
+        self._update_status_bar()
+
+    def _set_disconnected(self, sub: Subscription):
+        self._connected.discard(sub.label)
+        self._update_status_bar()
 
-                if msg.get("event") == "message":
+    # ── Metrics endpoint ─────────────────────────────────────────────────
+
+    @work(exclusive=True, group="metrics")
+    async def start_metrics_server(self):
+        """Serve METRICS as Prometheus text on 127.0.0.1:METRICS_PORT."""
+        try:
+            server = await asyncio.start_server(serve_metrics, "127.0.0.1", METRICS_PORT)
+        except OSError as e:
+            self.log.warning(f"Metrics endpoint disabled: {e}")
+            return
+        async with server:
+            await server.serve_forever()
+
+    # ── Ingest pipeline ──────────────────────────────────────────────────
+
+    @work(thread=True, exclusive=True, group="ingest")
+    def start_ingest(self):
+        """Decode, dedup and store incoming lines in batches, off the UI thread.
+
+        A replayed backlog becomes one store transaction and one UI update per
+        batch instead of a UI-thread round trip per message.
+        """
+        worker = get_current_worker()
+        while not self._store_ready.wait(0.5):
+            if worker.is_cancelled:
+                return
+        lines: list[tuple[str, str]] = []
+        # A decoded batch whose store or queue write failed
+        batch: tuple[list[Job], dict[str, int]] | None = None
+        delay = 0
+        while not worker.is_cancelled:
+            if batch is None and not lines:
+                try:
+                    lines = [self._ingest_queue.get(timeout=0.5)]
+                except queue.Empty:
+                    continue
+                deadline = time.monotonic() + INGEST_BATCH_WINDOW
+                while len(lines) < INGEST_BATCH_SIZE:
                     try:
-                        self.call_from_thread(self._dispatch, msg)
-                    except Exception as e:
-                        self.log.error(f"Dispatch failed: {e}")
+                        lines.append(self._ingest_queue.get(timeout=max(0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+            try:
+                with self.profiler.section(), INGEST_BATCH.time():
+                    if batch is None:
+                        batch, lines = self._decode_batch(lines), []
+                    self._store_batch(batch[0])
+            except (sqlite3.Error, OSError) as e:
+                # Nothing was checkpointed. Lines whose dedup lookup failed
+                # are decoded again; a decoded batch is retried as it is,
+                # since its jobs may already be in the store and so look seen
+                # (the store and queue writes are upserts)
+                delay = min(max(delay * 2, 1), 60)
+                count = len(batch[0]) if batch else len(lines)
+                self.log.error(f"Storing {count} messages failed: {e}. Retry in {delay}s...")
+                until = time.monotonic() + delay
+                while time.monotonic() < until and not worker.is_cancelled:
+                    time.sleep(0.1)
+                continue
+            delay = 0
+            jobs, last_ts = batch
+            batch = None
+            self.call_from_thread(self._on_jobs_ingested, jobs, last_ts)
 
-    def _set_connected(self):
-        self._connected = True
-        self._update_status_bar()
+    def _decode_batch(self, lines: list[tuple[str, str]]) -> tuple[list[Job], dict[str, int]]:
+        """New jobs in ``lines`` and the newest message time per subscription."""
+        jobs: list[Job] = []
+        seen: set[str] = set()
+        last_ts: dict[str, int] = {}
+        for label, line in lines:
+            try:
+                msg = json.loads(line)
+                job = decode_message(msg) if msg.get("event") == "message" else None
+                if ts := msg.get("time"):
+                    last_ts[label] = max(last_ts.get(label, ts), ts)
+            except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+                self.log.error(f"Dispatch failed: {e}")
+                continue
+            # Skip if already processed (dedup on restart/replay). A store error
+            # here fails the whole batch, which is retried rather than dropped
+            if job and job.id not in seen and not self.dedup.seen(job.id, job.time):
+                job.topic = label
+                seen.add(job.id)
+                jobs.append(job)
+        return jobs, last_ts
 
-    def _set_disconnected(self):
-        self._connected = False
-        self._update_status_bar()
+    def _store_batch(self, jobs: list[Job]):
+        if jobs:
+            # Before the store write, so a crash right after it still leaves
+            # these ids to be checked against the store on replay
+            self.dedup.reserve(min(job.time for job in jobs))
+            with STORE_WRITE.time():
+                self.store.add_many(jobs)
+            try:
+                if self.search:
+                    self.search.add(jobs)
+            except sqlite3.Error as e:
+                self.log.error(f"Search indexing failed: {e}")
+            if self.queue:
+                self.queue.put([job for job in jobs if job.type == "auto"])
+            self.dedup.add_many([(job.id, job.time) for job in jobs])
+            for job in jobs:
+                if job.type != "auto":
+                    self._run_interactive(job)
 
-    # ── Dispatch ─────────────────────────────────────────────────────────
+    def _on_jobs_ingested(self, jobs: list[Job], last_ts: dict[str, int]):
+        for job in jobs:
+            self._queue_row_update(JobHeader.of(job), new=True)
+            if job.type != "auto":
+                continue
+            if self.queue:
+                # Enqueued by the ingest thread; a worker will pick it up
+                self._watched.add(job.id)
+            else:
+                # Stays PENDING until its topic's scheduler has a free slot
+                self._scheduler_for(job).submit(job)
+        if len(jobs) > 1:
+            self.notify(f"{len(jobs)} new jobs")
+        # The batch is in the store, so the cursors may move past it
+        for label, ts in last_ts.items():
+            self.checkpoints[label].advance(ts)
 
-    def _dispatch(self, msg: dict):
-        body = msg.get("message", "")
-        msg_id = msg.get("id", str(msg.get("time", "")))
-        msg_time = msg.get("time", int(time.time()))
+    # ── Search index ─────────────────────────────────────────────────────
 
-        # Skip if already processed (dedup on restart)
-        if self.store.get(msg_id):
+    @work(thread=True, exclusive=True, group="search-catch-up")
+    def catch_up_search(self):
+        """Index history the search index hasn't seen yet (first run, crashes)."""
+        try:
+            indexed = self.search.catch_up(self.store)
+        except sqlite3.Error as e:
+            self.log.error(f"Search indexing failed: {e}")
             return
+        if indexed:
+            self.log.info(f"Indexed {indexed} jobs for search")
 
+    @work(thread=True, group="search-index")
+    def index_jobs(self, jobs: list[Job]):
+        if self.search is None:
+            return
         try:
-            payload = json.loads(body)
-            task_type = payload.get("type", "interactive")
-            prompt = payload.get("prompt", body)
-        except (json.JSONDecodeError, TypeError):
-            task_type = "interactive"
-            prompt = body
+            self.search.add(jobs)
+        except sqlite3.Error as e:
+            self.log.error(f"Search indexing failed: {e}")
 
-        if not prompt:
+    # ── Retention ────────────────────────────────────────────────────────
+
+    @work(thread=True, exclusive=True, group="retention")
+    def run_retention(self):
+        """Archive jobs beyond the retention limits, off the UI thread."""
+        try:
+            moved = apply_retention(self.store, self.archive, self.retention, self.search)
+        except (OSError, ImportError, sqlite3.Error) as e:
+            self.log.error(f"Retention failed: {e}")
             return
+        if moved:
+            self.call_from_thread(self._on_jobs_archived, moved)
 
-        job = Job(
-            id=msg_id,
-            time=msg_time,
-            prompt=prompt,
-            type=task_type,
-        )
+    def _on_jobs_archived(self, moved: int):
+        self._refresh_job_list()
+        self._update_status_bar()
+        self.notify(f"Archived {moved} old jobs")
 
-        if task_type == "auto":
-            job.status = JobStatus.PENDING
-            self.store.add(job)
-            self._refresh_job_list()
-            self._update_status_bar()
-            self.run_claude_auto(job)
-        else:
-            # Save interactive job for history (but don't track status)
-            job.status = JobStatus.COMPLETED  # Mark as "sent to Zellij"
-            self.store.add(job)
-            self._refresh_job_list()
-            self._update_status_bar()
-            self._run_interactive(job)
+    # ── Distributed mode ─────────────────────────────────────────────────
+
+    async def _claim_jobs(self):
+        """Worker: lease jobs from the shared queue while slots are free."""
+        capacity = sum(s.concurrency for s in self.subscriptions)
+        while self.queued == 0 and self.running < capacity:
+            claim = await asyncio.to_thread(self.queue.claim, WORKER_ID)
+            if claim is None:
+                return
+            job_id, attempts = claim
+            job = self.store.get(job_id)
+            if job is None or job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+                # Finished, but its worker died before dequeuing it
+                self.queue.done(job_id, WORKER_ID)
+                continue
+            if attempts > QUEUE_MAX_ATTEMPTS:
+                job.status = JobStatus.FAILED
+                job.error = f"Abandoned: its worker was lost {attempts - 1} times"
+                self._on_job_updated(job)
+                self.queue.done(job_id, WORKER_ID)
+                continue
+            if job.status == JobStatus.RUNNING:
+                # Its previous worker died or shut down mid-run: start over,
+                # like a standalone restart does, keeping none of that run's output
+                job.status = JobStatus.PENDING
+                job.steps = job.result = job.error = None
+                self._persist(job)
+            self._claimed.add(job_id)
+            self._scheduler_for(job).submit(job)
+
+    async def _renew_leases(self):
+        # Only leases claimed before the renewal query can be missing from it
+        claimed = set(self._claimed)
+        held = await asyncio.to_thread(self.queue.renew, WORKER_ID)
+        if lost := (claimed - held) & self._claimed:
+            # Another worker may already be rerunning them: stop ours without
+            # writing anything more to the shared store
+            self.log.warning(f"Leases lost, stopping: {sorted(lost)}")
+            self._claimed -= lost
+            for job_id in lost:
+                if run := self._runs.pop(job_id, None):
+                    job, worker = run
+                    worker.cancel()
+                    self._scheduler_for(job).release()
+
+    def _sync_shared_state(self):
+        """Leader: pick up what workers wrote to the shared store."""
+        version = self.store.data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        if self._watched:
+            for header in self.store.headers(list(self._watched)):
+                self._queue_row_update(header)
+                if header.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+                    self._watched.discard(header.id)
+        if isinstance(self.screen, JobDetailScreen) and (job := self.store.get(self.screen.job.id)):
+            self.screen.sync_steps(job.steps or [])
+            # data_version moves on any commit to the database, not just this job's
+            shown = self.screen.job
+            if (job.status, job.error, job.result) != (shown.status, shown.error, shown.result):
+                self.screen.refresh_job(job)
+        self._update_status_bar()
 
     # ── Interactive task (Zellij pane) ───────────────────────────────────
 
     def _run_interactive(self, job: Job):
+        import sh
+
         label = job.prompt[:20]
         try:
             zellij = sh.zellij.bake("--session", ZELLIJ_SESSION)
@@ -521,31 +3968,87 @@ class NtfyClaudeApp(App):
 
     # ── Auto task Worker ─────────────────────────────────────────────────
 
-    @work(thread=True, group="claude")
-    def run_claude_auto(self, job: Job):
+    @work(group="claude")
+    async def run_claude_auto(self, job: Job):
+        if self.role == "worker":
+            if job.id not in self._claimed:
+                # Its lease was lost while it waited for a slot
+                self._scheduler_for(job).release()
+                return
+            self._runs[job.id] = (job, get_current_worker())
         job.status = JobStatus.RUNNING
-        self.call_from_thread(self._on_job_updated, job)
+        self._on_job_updated(job)
+        PUBLISH_TO_START.observe(max(0.0, time.time() - job.time))
+        started = time.monotonic()
+        parse_s = 0.0
+
+        cache_key = None
+        if self.cache and job.cache_policy != "bypass":
+            fingerprint = await asyncio.to_thread(self.cache.fingerprint, NTFY_CLAUDE_DIR)
+            if fingerprint:
+                cache_key = ResultCache.key(job.prompt, CLAUDE_MODEL, fingerprint)
+                if job.cache_policy != "refresh" and (hit := self.cache.get(cache_key)):
+                    job.result = hit["result"]
+                    job.steps = hit["steps"]
+                    # Nothing was spent on this run
+                    job.cost_usd = 0.0
+                    job.duration_ms = int((time.monotonic() - started) * 1000)
+                    job.cached = True
+                    job.status = JobStatus.COMPLETED
+                    JOB_WALL.observe(time.monotonic() - started)
+                    self._on_job_finished(job)
+                    return
 
+        parser = StreamJsonParser()
+        worker: ClaudeProcess | None = None
+        leased = reusable = False
         try:
-            # Run in sandboxed work directory with full auto permissions
-            # (settings.json in NTFY_CLAUDE_DIR enables sandbox isolation)
-            proc = subprocess.run(
-                [
-                    "claude", "-p", job.prompt,
-                    "--model", "sonnet",
-                    "--output-format", "stream-json",
-                    "--verbose",
-                    "--max-turns", "100",
-                    "--dangerously-skip-permissions",
-                ],
-                capture_output=True,
-                text=True,
-                timeout=CLAUDE_TIMEOUT,
-                cwd=NTFY_CLAUDE_DIR,
-            )
+            if self.pool and (worker := self.pool.lease()):
+                # From here on `finally` hands the session back to the pool
+                leased = True
+                try:
+                    await worker.send(job.prompt, last=worker.jobs >= self.pool.max_jobs)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The session died while idle: cold-start instead
+                    leased = False
+                    self.pool.release(worker, False)
+                    worker = None
+            if worker is None:
+                worker = await ClaudeProcess.spawn(job.prompt)
+            proc = worker.proc
+            for raw in worker.preamble:
+                parser.feed(raw)
+            worker.preamble.clear()
+            submitted = time.monotonic()
+            # A warm session that will serve more jobs stays up after its result
+            keep = leased and worker.jobs < self.pool.max_jobs
 
-            steps, result_event = parse_stream_json(proc.stdout)
-            job.steps = steps if steps else None
+            # Consume stdout as it arrives, pushing new steps at most every
+            # STEP_FLUSH_INTERVAL so a chatty job doesn't flood the UI
+            async with asyncio.timeout(CLAUDE_TIMEOUT):
+                dirty = False
+                last_flush = time.monotonic()
+                async for raw in proc.stdout:
+                    t0 = time.perf_counter()
+                    new = parser.feed(raw)
+                    parse_s += time.perf_counter() - t0
+                    if new and len(parser.steps) == len(new):
+                        FIRST_STEP.observe(time.monotonic() - submitted)
+                    dirty = bool(new) or dirty
+                    if dirty and time.monotonic() - last_flush >= STEP_FLUSH_INTERVAL:
+                        job.steps = list(parser.steps)
+                        self._on_job_steps(job)
+                        dirty = False
+                        last_flush = time.monotonic()
+                    # The result is the last event; don't wait for EOF, which a
+                    # leftover child holding stdout could delay indefinitely
+                    if parser.result_event:
+                        break
+                if not keep:
+                    await worker.wait_exit()
+
+            job.steps = list(parser.steps) or None
+            result_event = parser.result_event
 
             if result_event:
                 job.result = result_event.get("result")
@@ -556,33 +4059,100 @@ class NtfyClaudeApp(App):
                     job.status = JobStatus.FAILED
                 else:
                     job.status = JobStatus.COMPLETED
+                    reusable = keep
             elif proc.returncode == 0:
-                job.result = proc.stdout
+                job.result = "\n".join(parser.other_lines)
                 job.status = JobStatus.COMPLETED
             else:
-                job.error = proc.stderr or f"Exit code {proc.returncode}"
+                if proc.returncode == 128 + signal.SIGXCPU:
+                    job.error = f"CPU time limit exceeded ({CLAUDE_CPU_SECONDS}s)"
+                else:
+                    job.error = (await worker.stderr_text()).strip() or f"Exit code {proc.returncode}"
                 job.status = JobStatus.FAILED
 
-        except subprocess.TimeoutExpired:
+        except TimeoutError:
+            # Keep whatever the job produced before it was killed
+            job.steps = list(parser.steps) or None
             job.error = f"Timeout after {CLAUDE_TIMEOUT}s"
             job.status = JobStatus.FAILED
-        except FileNotFoundError:
-            job.error = "claude command not found"
-            job.status = JobStatus.FAILED
         except Exception as e:
-            job.error = str(e)
+            # Also covers setting up the launch (cgroup, RUN_DIR); a missing
+            # claude binary is the launcher's exit 127 above
+            job.steps = list(parser.steps) or None
+            job.error = str(e) or type(e).__name__
             job.status = JobStatus.FAILED
+        finally:
+            if reusable:
+                self.pool.release(worker, True)
+            elif worker is not None:
+                # Finished one-shot process, timeout, failure or app shutdown
+                # (cancellation): stop the whole process group, then account
+                try:
+                    await worker.stop()
+                    usage = worker.usage()
+                    # A reused warm session's totals span several jobs
+                    if worker.jobs <= 1:
+                        job.peak_rss_mb, job.cpu_seconds = usage
+                finally:
+                    if leased:
+                        self.pool.release(worker, False)
 
-        self.call_from_thread(self._on_job_updated, job)
+        if cache_key and job.status == JobStatus.COMPLETED:
+            self.cache.put(cache_key, job)
+        PARSE_TIME.observe(parse_s)
+        JOB_WALL.observe(time.monotonic() - started)
+        if job.cost_usd is not None:
+            JOB_COST.observe(job.cost_usd)
+        self._on_job_finished(job)
 
-    def _on_job_updated(self, job: Job):
-        self.store.update(job)
-        self._refresh_job_list()
+    def _persist(self, job: Job):
+        """Write ``job`` from the UI thread; a locked database is retried later.
+
+        Raising here would fail a healthy job, or escape its worker and end
+        the app. A retry writes the job as it is by then.
+        """
+        try:
+            with STORE_WRITE.time():
+                self.store.update(job)
+        except sqlite3.OperationalError as e:
+            self.log.warning(f"Saving job {job.id} failed: {e}. Retry in {STORE_RETRY_DELAY:.0f}s...")
+            self.set_timer(STORE_RETRY_DELAY, lambda: self._persist(job))
+
+    def _on_job_steps(self, job: Job):
+        self._persist(job)
+        if isinstance(self.screen, JobDetailScreen) and self.screen.job.id == job.id:
+            self.screen.sync_steps(job.steps or [])
+
+    def _on_job_finished(self, job: Job):
+        self._on_job_updated(job)
+        # Result and steps become searchable once the job is done
+        self.index_jobs([job])
+        if self.queue:
+            self.queue.done(job.id, WORKER_ID)
+            self._claimed.discard(job.id)
+            self._runs.pop(job.id, None)
+        self._scheduler_for(job).release()
         self._update_status_bar()
 
+    def _on_job_updated(self, job: Job):
+        self._persist(job)
+        self._queue_row_update(JobHeader.of(job))
+        if isinstance(self.screen, JobDetailScreen) and self.screen.job.id == job.id:
+            self.screen.sync_steps(job.steps or [])
+            self.screen.refresh_job(job)
+
 
 # ── Entry point ──────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    app = NtfyClaudeApp()
-    app.run()
+    if "--worker" in sys.argv[1:]:
+        # Headless: no subscriber or UI, just claims and runs auto jobs
+        NtfyClaudeApp(role="worker").run(headless=True)
+    elif sys.argv[1:2] == ["--search-archive"]:
+        # Archived jobs aren't in the UI; look them up here
+        for job in JobArchive().search(" ".join(sys.argv[2:])):
+            stamp = datetime.fromtimestamp(job.time).strftime("%Y-%m-%d %H:%M")
+            print(f"{stamp}  {job.id}  {job.status.value:<9}  {job.prompt[:PROMPT_PREVIEW_LEN]!r}")
+    else:
+        app = NtfyClaudeApp()
+        app.run()
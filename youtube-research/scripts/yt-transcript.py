@@ -3,14 +3,34 @@
 # requires-python = ">=3.11"
 # dependencies = [
 #   "youtube-transcript-api>=1.0.0",
+#   "requests>=2.31",
 # ]
 # ///
 
-"""YouTube 字幕取得スクリプト - タイムスタンプ付きマークダウンで出力"""
+"""YouTube 字幕取得スクリプト - タイムスタンプ付きマークダウンで出力
 
-import sys
+複数の URL / ID を引数・ファイル（-f, `-` で標準入力）・パイプで渡すとバッチモードになり、
+共有 HTTP セッションと上限付きスレッドプールで並行取得して JSON のサマリーを出力する。
+環境変数 YT_TRANSCRIPT_BASE_URL を設定すると https://www.youtube.com への
+リクエストをその URL に向ける（ローカルのスタンドインでの動作確認用）。
+"""
+
+import argparse
+import json
+import os
+import random
 import re
-from youtube_transcript_api import YouTubeTranscriptApi
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from youtube_transcript_api import RequestBlocked, YouTubeRequestFailed, YouTubeTranscriptApi
+
+YOUTUBE_URL = "https://www.youtube.com"
+BACKOFF_MAX = 30.0
 
 
 def extract_video_id(url: str) -> str:
@@ -34,24 +54,51 @@ def format_timestamp(seconds: float) -> str:
     return f"{m:02d}:{s:02d}"
 
 
-def main():
-    args = [a for a in sys.argv[1:] if not a.startswith("-")]
-    flags = {a for a in sys.argv[1:] if a.startswith("-")}
-    timestamps = "--timestamps" in flags or "-t" in flags
+class RebasedSession(requests.Session):
+    """www.youtube.com 宛てのリクエストを base_url に付け替えるセッション"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(YOUTUBE_URL):
+            url = self.base_url + url[len(YOUTUBE_URL):]
+        return super().request(method, url, *args, **kwargs)
 
-    if not args:
-        print("Usage: yt-transcript.py <youtube-url-or-id> [language] [--timestamps]", file=sys.stderr)
-        sys.exit(1)
 
-    url = args[0]
-    preferred_langs = args[1].split(",") if len(args) > 1 else ["ja", "en"]
+def make_session(jobs: int) -> requests.Session:
+    base_url = os.environ.get("YT_TRANSCRIPT_BASE_URL")
+    session = RebasedSession(base_url) if base_url else requests.Session()
+    # 全ワーカーで接続を使い回せるようにプールをワーカー数に合わせる
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(jobs, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    video_id = extract_video_id(url)
-    ytt = YouTubeTranscriptApi()
 
-    transcript = ytt.fetch(video_id, languages=preferred_langs)
-    entries = list(transcript)
+def http_status(error: BaseException | None) -> int | None:
+    # YouTubeRequestFailed はメッセージしか持たないので、送出元の HTTPError からステータスを取る
+    while error is not None:
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code
+        error = error.__cause__ or error.__context__
+    return None
 
+
+def is_retryable(error: Exception) -> bool:
+    status = http_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (RequestBlocked, YouTubeRequestFailed, requests.RequestException))
+
+
+def describe_error(error: Exception) -> str:
+    cause = getattr(error, "cause", "") or str(error)
+    return f"{type(error).__name__}: {' '.join(cause.split())}"
+
+
+def write_transcript(video_id: str, entries: list, timestamps: bool) -> tuple[str, float]:
     total_duration = max(e.start + e.duration for e in entries) if entries else 0
 
     output_path = f"/tmp/yt-transcript-{video_id}.md"
@@ -67,11 +114,130 @@ def main():
                 f.write(f"[{ts}](https://www.youtube.com/watch?v={video_id}&t={t}) {e.text}\n\n")
             else:
                 f.write(f"{ts} {e.text}\n\n")
+    return output_path, total_duration
+
+
+class Fetcher:
+    """共有セッションで字幕を取得し、失敗時は指数バックオフで再試行する"""
+
+    def __init__(self, languages: list[str], timestamps: bool, jobs: int, retries: int, backoff: float):
+        self.languages = languages
+        self.timestamps = timestamps
+        self.retries = retries
+        self.backoff = backoff
+        self.session = make_session(jobs)
+        # YouTubeTranscriptApi はスレッドセーフではないのでスレッドごとに作り、セッションだけ共有する
+        self._local = threading.local()
+
+    def api(self) -> YouTubeTranscriptApi:
+        if not hasattr(self._local, "api"):
+            self._local.api = YouTubeTranscriptApi(http_client=self.session)
+        return self._local.api
+
+    def fetch(self, video_id: str) -> dict:
+        started = time.perf_counter()
+        result = {"video_id": video_id, "status": "error", "attempts": 0}
+        for attempt in range(self.retries + 1):
+            result["attempts"] = attempt + 1
+            try:
+                entries = list(self.api().fetch(video_id, languages=self.languages))
+            except Exception as e:
+                result["error"] = describe_error(e)
+                if attempt == self.retries or not is_retryable(e):
+                    break
+                delay = min(self.backoff * 2**attempt, BACKOFF_MAX)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            path, duration = write_transcript(video_id, entries, self.timestamps)
+            result.pop("error", None)
+            result.update(status="ok", entries=len(entries), duration=format_timestamp(duration), saved=path)
+            break
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+
+def read_inputs(path: str) -> list[str]:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="YouTube 字幕をマークダウンで /tmp に保存する")
+    parser.add_argument("videos", nargs="*", help="YouTube URL または動画 ID（複数可）")
+    parser.add_argument("-l", "--lang", help="優先言語（カンマ区切り、既定: ja,en）")
+    parser.add_argument("-t", "--timestamps", action="store_true", help="タイムスタンプをリンクにする")
+    parser.add_argument("-f", "--file", help="URL / ID を 1 行ずつ読むファイル（- で標準入力）")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="並行取得数（既定: 4）")
+    parser.add_argument("--retries", type=int, default=3, help="動画ごとの再試行回数（既定: 3）")
+    parser.add_argument("--backoff", type=float, default=1.0, help="最初の再試行までの秒数、以降倍々（既定: 1.0）")
+    parser.add_argument("--json", action="store_true", help="1 件でも JSON サマリーを出力する")
+    args = parser.parse_args()
+
+    # 旧形式 `yt-transcript.py <url> ja,en` の言語指定を受け付ける（位置引数がちょうど 2 つのときだけ）
+    if len(args.videos) == 2 and not args.lang:
+        try:
+            extract_video_id(args.videos[-1])
+        except ValueError:
+            args.lang = args.videos.pop()
+    if args.file:
+        args.videos += read_inputs(args.file)
+    elif not args.videos and not sys.stdin.isatty():
+        args.videos = read_inputs("-")
+    if not args.videos:
+        parser.print_usage(sys.stderr)
+        sys.exit(1)
+    return args
+
 
-    print(f"video_id: {video_id}")
-    print(f"entries: {len(entries)}")
-    print(f"duration: {format_timestamp(total_duration)}")
-    print(f"saved: {output_path}")
+def main():
+    args = parse_args()
+    preferred_langs = args.lang.split(",") if args.lang else ["ja", "en"]
+    batch = args.json or len(args.videos) > 1
+
+    results, video_ids = [], []
+    for url in args.videos:
+        try:
+            video_id = extract_video_id(url)
+        except ValueError as e:
+            results.append({"input": url, "status": "error", "attempts": 0, "error": str(e)})
+            continue
+        if video_id not in video_ids:
+            video_ids.append(video_id)
+
+    fetcher = Fetcher(preferred_langs, args.timestamps, args.jobs, args.retries, args.backoff)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = [pool.submit(fetcher.fetch, video_id) for video_id in video_ids]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            if batch:
+                detail = f"{result['entries']} entries" if result["status"] == "ok" else result["error"]
+                print(f"[{i}/{len(video_ids)}] {result['video_id']} {result['status']}: {detail}", file=sys.stderr)
+    results += [future.result() for future in futures]
+    fetcher.session.close()
+    ok = sum(r["status"] == "ok" for r in results)
+
+    if batch:
+        summary = {
+            "ok": ok,
+            "failed": len(results) - ok,
+            "seconds": round(time.perf_counter() - started, 3),
+            "results": results,
+        }
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    elif results[0]["status"] == "ok":
+        result = results[0]
+        print(f"video_id: {result['video_id']}")
+        print(f"entries: {result['entries']}")
+        print(f"duration: {result['duration']}")
+        print(f"saved: {result['saved']}")
+    else:
+        print(results[0]["error"], file=sys.stderr)
+
+    if ok < len(results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":